@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""
+purpose: End-to-end benchmarks for Laundromatic.
+    Runs the bot against a local fake Discord (REST API + gateway),
+        with sensor edges simulated by gpiozero's MockFactory.
+    Runs offline, on any Linux box (no Raspberry Pi or Discord token needed).
+
+    Reports:
+        - startup time (main() until the online message is posted)
+        - sensor edge -> channel post latency
+        - DM fan-out duration and throughput for each watcher count
+        - !watchlist, !add, !id and !status command latency
+        - resident memory at startup, and peak RSS of the process
+        - with --low-memory, --notifier and --agent, all of the above in the bot's other modes too
+
+    NOTE: each watcher count runs in a process of its own,
+        so peak RSS isn't carried over from one run to the next.
+        The fake Discord runs in the same process, so RSS includes it too.
+
+author: Jeff Reeves
+"""
+
+
+#==[ IMPORTS ]=============================================================================================================================
+
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import logging
+import resource
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import timedelta
+from aiohttp import web
+import gpiozero # type: ignore
+from gpiozero.pins.mock import MockFactory # type: ignore
+import discord
+
+
+#==[ CONFIG ]==============================================================================================================================
+
+host          = '127.0.0.1'
+bot_id        = 1000
+guild_id      = 2000
+channel_id    = 3000
+channel_name  = 'laundromatic'
+first_user_id = 10000  # users get IDs from here on
+first_dm_id   = 500000 # DM channels get IDs from here on (plus the user ID)
+gpiopin       = 4
+timeout       = 120    # seconds to wait on the bot before giving up
+extra_users   = 50     # users in the guild that aren't watchers, for !add
+webhook_id    = 400000000000000000
+webhook_token = 'benchmark' * 7 # Discord's webhook tokens are 60-68 characters
+
+# modes the bot can run in, and the settings for each
+modes = {
+    'default':    {},
+    'low-memory': { 'lowmemory': True },
+    'notifier':   { 'webhook': f'https://discord.com/api/webhooks/{webhook_id}/{webhook_token}' }, # no gateway, so no commands
+    'agent':      { 'listen': 'unix:agent.sock' }, # sensor edges go through a sensor agent (on a thread of this process)
+}
+
+# prefix of the line each benchmark process prints its results on
+results_prefix = 'RESULTS '
+
+
+#==[ FAKE DISCORD ]========================================================================================================================
+
+# raw user data, as sent by Discord
+def user_data(user_id, name = None, bot = False):
+    return {
+        'id':            str(user_id),
+        'username':      name or f'user{user_id}',
+        'discriminator': '0001',
+        'avatar':        None,
+        'bot':           bot,
+    }
+
+# raw message data, as sent by Discord
+def message_data(message_id, to_channel_id, content, author):
+    return {
+        'id':               str(message_id),
+        'channel_id':       str(to_channel_id),
+        'content':          content,
+        'author':           author,
+        'type':             0,
+        'tts':              False,
+        'pinned':           False,
+        'mention_everyone': False,
+        'mentions':         [],
+        'mention_roles':    [],
+        'attachments':      [],
+        'embeds':           [],
+        'timestamp':        '2021-01-01T00:00:00+00:00',
+        'edited_timestamp': None,
+    }
+
+# JSON response, as sent by Discord
+#   NOTE: discord.py only parses JSON when the content type is exactly "application/json"
+def json_response(data, status = 200):
+    return web.Response(body    = json.dumps(data).encode('utf-8'),
+                        status  = status,
+                        headers = { 'Content-Type': 'application/json' })
+
+# fake Discord REST API and gateway, served from a thread of its own
+#   NOTE: every request the bot makes is recorded with the time it arrived,
+#       which is what all the latencies are measured against
+class FakeDiscord:
+
+    def __init__(self, user_ids):
+        self.user_ids        = user_ids
+        self.requests        = [] # format: (perf_counter, method, path, payload, status)
+        self.condition       = threading.Condition()
+        self.loop            = asyncio.new_event_loop()
+        self.sockets         = []
+        self.sequence        = 0
+        self.next_message_id = 900000
+        self.port            = None
+        self.ready           = threading.Event()
+        self.members_intent  = True # whether the bot asked for guild members when it identified
+
+    #--[ SERVER ]------------------------------------------------------------------------------------------------------
+
+    # start serving, and point discord.py at the fake
+    def start(self):
+        threading.Thread(target = self.serve, name = 'fake-discord', daemon = True).start()
+        self.ready.wait()
+        discord.http.Route.BASE             = f'http://{host}:{self.port}/api/v7'
+        discord.webhook.WebhookAdapter.BASE = f'http://{host}:{self.port}/api/v7'
+        return
+
+    def serve(self):
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.router.add_get( '/gateway',                          self.handle_gateway)
+        app.router.add_get( '/api/v7/gateway',                   self.handle_get_gateway)
+        app.router.add_get( '/api/v7/users/@me',                 self.handle_get_me)
+        app.router.add_get( '/api/v7/users/{user_id}',           self.handle_get_user)
+        app.router.add_post('/api/v7/users/@me/channels',        self.handle_create_dm)
+        app.router.add_post('/api/v7/channels/{channel_id}/messages', self.handle_send_message)
+        app.router.add_post('/api/v7/webhooks/{webhook_id}/{webhook_token}', self.handle_execute_webhook)
+        runner = web.AppRunner(app)
+        self.loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, host, 0)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+        return
+
+    # record a request, and wake up anyone waiting on it
+    def record(self, method, path, payload = None, status = 200):
+        with self.condition:
+            self.requests.append((time.perf_counter(), method, path, payload, status))
+            self.condition.notify_all()
+        return
+
+    # get the index of the next request, to wait for requests made from here on
+    def mark(self):
+        with self.condition:
+            return len(self.requests)
+
+    # wait for `count` requests (from index `start` on) that match `predicate`
+    # returns the last matching request
+    def wait_for(self, predicate, start = 0, count = 1, timeout = timeout):
+        deadline = time.perf_counter() + timeout
+        matches  = 0
+        position = start
+        with self.condition:
+            while True:
+                # only look at requests recorded since the last look
+                for request in self.requests[position:]:
+                    if predicate(request):
+                        matches += 1
+                        if matches == count:
+                            return request
+                position  = len(self.requests)
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise TimeoutError(f'Timed out waiting for {count} requests ({matches} seen)')
+                self.condition.wait(remaining)
+
+    # send a gateway event to the bot, from any thread
+    def dispatch(self, event, data):
+        asyncio.run_coroutine_threadsafe(self.send_dispatch_all(event, data), self.loop).result()
+        return
+
+    #--[ REST API ]----------------------------------------------------------------------------------------------------
+
+    async def handle_get_gateway(self, request):
+        return json_response({ 'url': f'ws://{host}:{self.port}/gateway' })
+
+    async def handle_get_me(self, request):
+        return json_response(user_data(bot_id, 'laundromatic', bot = True))
+
+    async def handle_get_user(self, request):
+        self.record('GET', request.path)
+        return json_response(user_data(request.match_info['user_id']))
+
+    async def handle_create_dm(self, request):
+        payload = await request.json()
+        self.record('POST', request.path, payload)
+        recipient_id = int(payload['recipient_id'])
+        return json_response({
+            'id':              str(first_dm_id + recipient_id),
+            'type':            1,
+            'last_message_id': None,
+            'recipients':      [ user_data(recipient_id) ],
+        })
+
+    async def handle_send_message(self, request):
+        payload = await request.json()
+        content = payload.get('content') or ''
+
+        # messages over Discord's limit are rejected, the same way Discord does
+        if len(content) > 2000:
+            self.record('POST', request.path, payload, status = 400)
+            return json_response({ 'code': 50035, 'message': 'Invalid Form Body' }, status = 400)
+
+        self.record('POST', request.path, payload)
+        self.next_message_id += 1
+        return json_response(message_data(self.next_message_id,
+                                              request.match_info['channel_id'],
+                                              content,
+                                              user_data(bot_id, 'laundromatic', bot = True)))
+
+    # webhook posts land in the management channel
+    async def handle_execute_webhook(self, request):
+        payload = await request.json()
+        self.record('POST', f'/api/v7/channels/{channel_id}/messages', payload)
+        return web.Response(status = 204, headers = { 'Content-Type': 'text/plain' })
+
+    #--[ GATEWAY ]-----------------------------------------------------------------------------------------------------
+
+    async def handle_gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.append(ws)
+        await ws.send_json({ 'op': 10, 'd': { 'heartbeat_interval': 41250 } })
+        async for message in ws:
+            payload = json.loads(message.data)
+            if payload['op'] == 1:   # heartbeat
+                await ws.send_json({ 'op': 11 })
+            elif payload['op'] == 2: # identify
+                self.members_intent = bool(payload['d'].get('intents', 0) & discord.Intents(members = True).value)
+                await self.send_dispatch(ws, 'READY', {
+                    'v':                6,
+                    'user':             user_data(bot_id, 'laundromatic', bot = True),
+                    'guilds':           [ { 'id': str(guild_id), 'unavailable': True } ],
+                    'session_id':       'benchmark',
+                    'private_channels': [],
+                    'relationships':    [],
+                })
+                await self.send_dispatch(ws, 'GUILD_CREATE', self.guild_data())
+            elif payload['op'] == 8: # request guild members, by username prefix
+                self.record('GATEWAY', 'request_guild_members', payload['d'])
+                query   = payload['d'].get('query', '').casefold()
+                members = [ member for member in self.member_data() if member['user']['username'].casefold().startswith(query) ]
+                await self.send_dispatch(ws, 'GUILD_MEMBERS_CHUNK', {
+                    'guild_id':    str(guild_id),
+                    'members':     members[:payload['d'].get('limit') or 100],
+                    'chunk_index': 0,
+                    'chunk_count': 1,
+                    'nonce':       payload['d'].get('nonce'),
+                })
+        self.sockets.remove(ws)
+        return ws
+
+    async def send_dispatch(self, ws, event, data):
+        self.sequence += 1
+        await ws.send_json({ 'op': 0, 't': event, 's': self.sequence, 'd': data })
+        return
+
+    async def send_dispatch_all(self, event, data):
+        for ws in self.sockets:
+            await self.send_dispatch(ws, event, data)
+        return
+
+    # every user as a member of the guild, plus the bot
+    def member_data(self):
+        members = [ { 'user': user_data(user_id), 'roles': [], 'joined_at': '2021-01-01T00:00:00+00:00', 'deaf': False, 'mute': False }
+                    for user_id in self.user_ids ]
+        members.append({ 'user': user_data(bot_id, 'laundromatic', bot = True), 'roles': [], 'joined_at': '2021-01-01T00:00:00+00:00', 'deaf': False, 'mute': False })
+        return members
+
+    # a single guild, with the management channel and every user as a member
+    #   NOTE: like Discord, only the bot itself is sent as a member without the members intent
+    def guild_data(self):
+        members = self.member_data() if self.members_intent else self.member_data()[-1:]
+        return {
+            'id':                            str(guild_id),
+            'name':                          'benchmark',
+            'owner_id':                      str(first_user_id),
+            'region':                        'us-west',
+            'member_count':                  len(self.user_ids) + 1,
+            'large':                         False,
+            'members':                       members,
+            'channels':                      [ { 'id': str(channel_id), 'type': 0, 'name': channel_name, 'position': 0, 'permission_overwrites': [] } ],
+            'roles':                         [ { 'id': str(guild_id), 'name': '@everyone', 'permissions': '104324673', 'position': 0, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False } ],
+            'emojis':                        [],
+            'features':                      [],
+            'voice_states':                  [],
+            'presences':                     [],
+            'verification_level':            0,
+            'default_message_notifications': 0,
+            'explicit_content_filter':       0,
+            'mfa_level':                     0,
+            'premium_tier':                  0,
+            'system_channel_flags':          0,
+        }
+
+
+#==[ BENCHMARKS ]==========================================================================================================================
+
+# predicates for recorded requests
+def is_channel_post(text):
+    return lambda request: request[2] == f'/api/v7/channels/{channel_id}/messages' and text in (request[3] or {}).get('content', '')
+
+def is_dm_post(text):
+    return lambda request: request[2] != f'/api/v7/channels/{channel_id}/messages' and request[2].endswith('/messages') and text in (request[3] or {}).get('content', '')
+
+# summarize a list of durations (seconds) as milliseconds
+def summarize(durations):
+    if not durations:
+        return None
+    durations = sorted(durations)
+    return {
+        'p50': round(statistics.median(durations) * 1000, 3),
+        'max': round(durations[-1] * 1000, 3),
+    }
+
+# run the bot with `watchers` watchers, and measure it
+def run_benchmark(watchers, iterations, mode = 'default'):
+
+    # keep the watcher store, profile cache and log of every run apart
+    os.chdir(tempfile.mkdtemp(prefix = 'laundromatic-benchmark-'))
+    import main as laundromatic
+    import sensor_agent
+
+    watcher_ids = [ first_user_id + index for index in range(watchers) ]
+    extra_ids   = [ first_user_id + watchers + index for index in range(extra_users) ]
+    fake        = FakeDiscord(watcher_ids + extra_ids)
+    fake.start()
+
+    gpiozero.Device.pin_factory = MockFactory()
+    pin     = gpiozero.Device.pin_factory.pin(gpiopin)
+    author  = user_data(extra_ids[0])
+    results = { 'watchers': watchers, 'mode': mode }
+    loop    = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # the agent retries until the bot listens, and replays every edge made before then
+    if mode == 'agent':
+        agent = sensor_agent.run_agent(modes['agent']['listen'], { sensor_agent.default_machine: { 'gpiopin': gpiopin } }, 'benchmark')
+        threading.Thread(target = asyncio.run, args = (agent,), name = 'sensor-agent', daemon = True).start()
+
+    # run a command, returning the time until the bot replies in the channel
+    def run_command(content, reply):
+        start      = fake.mark()
+        start_time = time.perf_counter()
+        fake.next_message_id += 1
+        fake.dispatch('MESSAGE_CREATE', { **message_data(fake.next_message_id, channel_id, content, author), 'guild_id': str(guild_id) })
+        request = fake.wait_for(is_channel_post(reply), start)
+        return (request[0] - start_time, request[4])
+
+    # drive the bot through each benchmark, then stop it
+    def drive(start_time):
+        try:
+            # startup, until the online message is posted and DMed to every watcher
+            request = fake.wait_for(is_channel_post('is online'))
+            results['startup_s'] = round(request[0] - start_time, 3)
+            if watchers:
+                request = fake.wait_for(is_dm_post('is online'), count = watchers)
+                results['online_fan_out_s'] = round(request[0] - start_time - results['startup_s'], 3)
+            results['startup_rss_mib'] = round(laundromatic.resident_memory(), 1)
+
+            # the sensor is armed before the bot connects, and its events are handled as soon as it's ready,
+            #   so the first edge must get through (and its DMs must all be sent) before measuring
+            #   NOTE: an edge that's lost fails the benchmark, rather than being retried
+            start = fake.mark()
+            pin.drive_low()
+            pin.drive_high()
+            fake.wait_for(is_channel_post('complete'), start)
+            if watchers:
+                fake.wait_for(is_dm_post('complete'), start, count = watchers)
+
+            # sensor edges, until the "complete" message is posted and DMed to every watcher
+            edge_to_post = []
+            fan_out      = []
+            for iteration in range(iterations):
+                start      = fake.mark()
+                edge_time  = time.perf_counter()
+                pin.drive_low()  # light on (active low, the sensor is pulled up)
+                pin.drive_high()
+                request = fake.wait_for(is_channel_post('complete'), start)
+                edge_to_post.append(request[0] - edge_time)
+                if watchers:
+                    request = fake.wait_for(is_dm_post('complete'), start, count = watchers)
+                    fan_out.append(request[0] - edge_time)
+            results['edge_to_post_ms'] = summarize(edge_to_post)
+            if fan_out:
+                results['fan_out_ms']         = summarize(fan_out)
+                results['fan_out_dms_per_s']  = round(watchers / statistics.median(fan_out), 1)
+
+            # commands (there are none without a gateway session)
+            if mode == 'notifier':
+                return
+            watchlist = []
+            add       = []
+            user_id   = []
+            status_ms = []
+            statuses  = set()
+            for iteration in range(iterations):
+                duration, status = run_command('!watchlist', 'atch')
+                watchlist.append(duration)
+                statuses.add(status)
+                duration, status = run_command(f'!add {extra_ids[iteration + 1]}', 'Added')
+                add.append(duration)
+                statuses.add(status)
+                # the same username each time, so only the first has to be searched for in low-memory mode
+                duration, status = run_command(f'!id user{extra_ids[-1]}', 'user ID is')
+                user_id.append(duration)
+                statuses.add(status)
+                duration, status = run_command('!status', 'Status')
+                status_ms.append(duration)
+                statuses.add(status)
+            results['watchlist_ms'] = summarize(watchlist)
+            results['add_ms']       = summarize(add)
+            results['id_ms']        = summarize(user_id)
+            results['status_ms']    = summarize(status_ms)
+            results['command_http_statuses'] = sorted(statuses)
+        except Exception as e:
+            results['error'] = repr(e)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+        return
+
+    bot_args = argparse.Namespace(token       = 'benchmark',
+                                  channel     = channel_name,
+                                  delay       = timedelta(microseconds = 1),
+                                  gpiopin     = gpiopin,
+                                  loglevel    = logging.WARNING,
+                                  prefix      = '!',
+                                  watchers    = [ str(user_id) for user_id in watcher_ids ],
+                                  concurrency = None,
+                                  machines    = None,
+                                  detector    = None,
+                                  lowmemory   = None,
+                                  webhook     = None,
+                                  listen      = None,
+                                  secret      = None,
+                                  notice      = 0,
+                                  metrics     = None,
+                                  record      = None,
+                                  startupprofile = False,
+                                  guilds      = None,
+                                  shards      = None,
+                                  coalesce    = 0) # edges are fired back to back, coalescing would hold them back
+    vars(bot_args).update(modes[mode])
+
+    start_time = time.perf_counter()
+    threading.Thread(target = drive, args = (start_time,), name = 'benchmark-driver', daemon = True).start()
+    laundromatic.main(bot_args)
+
+    results['peak_rss_mib'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return results
+
+# run every watcher count (in each mode) in a process of its own, and print a report
+def run_benchmarks(watcher_counts, iterations, as_json, run_modes = ('default',)):
+    report = []
+    runs   = [ (watchers, mode) for watchers in watcher_counts for mode in run_modes ]
+    for watchers, mode in runs:
+        process = subprocess.run([ sys.executable, os.path.abspath(__file__),
+                                   '--run', str(watchers),
+                                   '--mode', mode,
+                                   '--iterations', str(iterations) ],
+                                 cwd            = os.path.dirname(os.path.abspath(__file__)),
+                                 capture_output = True,
+                                 text           = True)
+        # the bot logs to stdout too, so the results are on a line of their own
+        lines = [ line for line in process.stdout.splitlines() if line.startswith(results_prefix) ]
+        if lines:
+            results = json.loads(lines[-1][len(results_prefix):])
+        else:
+            results = { 'watchers': watchers, 'mode': mode, 'error': process.stderr.strip().splitlines()[-1:] }
+        report.append(results)
+        if not as_json:
+            print(format_results(results), flush = True)
+
+    if as_json:
+        print(json.dumps(report, indent = 4))
+    return report
+
+# format the results of a single run as a line of the report
+def format_results(results):
+    mode = f" ({results['mode']})" if results.get('mode', 'default') != 'default' else ''
+    if 'error' in results:
+        return f"{results['watchers']:>5} watchers{mode}: ERROR {results['error']}"
+
+    def ms(key):
+        summary = results.get(key)
+        return f"{summary['p50']:>9.1f} / {summary['max']:>9.1f}ms" if summary else f"{'-':>24}"
+
+    return (f"{results['watchers']:>5} watchers{mode:<13} | "
+            f"startup {results['startup_s']:>6.2f}s | "
+            f"edge->post {ms('edge_to_post_ms')} | "
+            f"fan-out {ms('fan_out_ms')} ({results.get('fan_out_dms_per_s', '-')} DMs/s) | "
+            f"!watchlist {ms('watchlist_ms')} | "
+            f"!add {ms('add_ms')} | "
+            f"!id {ms('id_ms')} | "
+            f"!status {ms('status_ms')} | "
+            f"HTTP {results.get('command_http_statuses', '-')} | "
+            f"RSS {results['startup_rss_mib']:.1f}MiB at startup, {results['peak_rss_mib']:.1f}MiB peak")
+
+
+#==[ COMMAND LINE ]========================================================================================================================
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = 'End-to-end benchmarks for Laundromatic, against a local fake Discord')
+
+    parser.add_argument('-w',
+                        '--watchers',
+                        dest    = 'watchers',
+                        type    = int,
+                        nargs   = '+',
+                        default = [ 10, 100, 1000 ],
+                        help    = 'Watcher counts to benchmark (space separated list)')
+
+    parser.add_argument('-i',
+                        '--iterations',
+                        dest    = 'iterations',
+                        type    = int,
+                        default = 5,
+                        help    = 'Iterations of each benchmark')
+
+    parser.add_argument('--low-memory',
+                        dest    = 'low_memory',
+                        action  = 'store_true',
+                        help    = "Also run each watcher count in the bot's low-memory mode")
+
+    parser.add_argument('--notifier',
+                        dest    = 'notifier',
+                        action  = 'store_true',
+                        help    = "Also run each watcher count in the bot's notifier (webhook) mode")
+
+    parser.add_argument('--agent',
+                        dest    = 'agent',
+                        action  = 'store_true',
+                        help    = 'Also run each watcher count with the sensor behind a sensor agent')
+
+    parser.add_argument('--json',
+                        dest    = 'json',
+                        action  = 'store_true',
+                        help    = 'Print the report as JSON')
+
+    parser.add_argument('--mode',
+                        dest    = 'mode',
+                        choices = list(modes),
+                        default = 'default',
+                        help    = argparse.SUPPRESS) # mode of a single run, used internally
+
+    parser.add_argument('--run',
+                        dest    = 'run',
+                        type    = int,
+                        help    = argparse.SUPPRESS) # runs a single watcher count, used internally
+
+    args = parser.parse_args()
+
+    if args.run is not None:
+        print(results_prefix + json.dumps(run_benchmark(args.run, args.iterations, args.mode)), flush = True)
+    else:
+        run_modes = [ 'default' ] + [ 'low-memory' ] * args.low_memory + [ 'notifier' ] * args.notifier + [ 'agent' ] * args.agent
+        run_benchmarks(args.watchers, args.iterations, args.json, run_modes)
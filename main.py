@@ -10,7 +10,13 @@ author: Jeff Reeves
 
 #==[ IMPORTS ]=============================================================================================================================
 
+# NOTE: discord, aiohttp and gpiozero take seconds to import on a Pi,
+#   so they're imported in main() once needed, after the sensors are armed (see STARTUP)
+import time
+startup_started = time.monotonic() # before anything else is imported, for the startup profile
 import logging
+import logging.handlers
+import atexit
 from datetime import datetime, timedelta
 import sys
 import os
@@ -20,28 +26,615 @@ import base64
 import argparse
 import getpass
 import asyncio
-import gpiozero # type: ignore
-import discord
-from discord.ext import commands
+import queue
+import heapq
+import bisect
+import random
+import itertools
+import threading
+import concurrent.futures
+import sqlite3
+import resource
+import signal
+from sensor_agent import (default_machine, detector_defaults, parse_machine, sample_signal,
+                          frame_hello, frame_event, event_done, event_off, event_names, read_frame, decode_hello, decode_event, encode_ack, start_server, parse_address,
+                          challenge_body, encode_challenge, handshake_timeout,
+                          open_trace, record_edge)
 
 
 #==[ CONFIG ]==============================================================================================================================
 
 # logging
+#   NOTE: the logger only puts records on a queue, the console and file handlers
+#       run on the log listener's thread, so slow writes never stall the event loop
 formatter = logging.Formatter('[ %(asctime)-23s ][ %(name)-8s ][ %(levelname)-8s ][ %(funcName)-20s ] (%(filename)s:%(lineno)s) - %(message)s')
 
+log_file           = 'laundromatic.log'
+log_file_max_bytes = 5 * 1024 * 1024 # rotate the log file once it reaches 5 MiB
+log_file_backups   = 5               # keep this many rotated log files
+
 console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setFormatter(formatter)
 console_handler.setLevel(logging.DEBUG)
 
-file_handler = logging.FileHandler('laundromatic.log')
+file_handler = logging.handlers.RotatingFileHandler(log_file,
+                                                    maxBytes    = log_file_max_bytes,
+                                                    backupCount = log_file_backups)
 file_handler.setFormatter(formatter)
 file_handler.setLevel(logging.DEBUG)
 
+log_queue    = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue,
+                                              console_handler,
+                                              file_handler,
+                                              respect_handler_level = True)
+log_listener.start()
+atexit.register(log_listener.stop) # flush any queued records on exit
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+# config file, reloaded on SIGHUP or when it changes
+config_file          = 'config.json'
+config_poll_interval = 2.0 # seconds between checks of the config file for changes
+
+# user profile cache
+profile_cache_file = 'profiles.json'
+profile_cache_ttl  = timedelta(days = 1)
+
+# watcher store
+watcher_store_file = 'watchers.db'
+
+# history of completed cycles, with daily rollups for stats
+history_file         = 'history.db'
+history_list_default = 10   # cycles listed by !history
+history_list_max     = 25   # cycles listed by !history, at most (so the list fits in one message)
+stats_days           = 30   # days !stats covers
+stats_days_max       = 3660 # days !stats covers, at most (about 10 years)
+
+# estimates of how long cycles take, per machine and time of day, updated as each cycle ends
+estimate_bucket_hours = 4                     # hours of the day in each time-of-day estimate
+estimate_weight       = 0.1                   # weight of each new cycle, once the estimate has 1 / weight cycles
+estimate_min_cycles   = 3                     # cycles needed before an estimate is used
+estimate_max_duration = timedelta(hours = 4)  # longer cycles (the machine sat empty) aren't estimated from
+
+# outbox of completion messages not yet delivered
+outbox_file     = 'outbox.db'
+outbox_max_rows = 10000             # undelivered messages kept, at most (oldest are dropped first)
+outbox_max_age  = timedelta(days = 1) # undelivered messages older than this are dropped
+
+# maximum number of sensor events waiting to be handled by the event loop
+sensor_queue_size = 64
+
+# outbound message priorities (lower is sent first)
+priority_alert     = 0 # completion alerts and error notifications
+priority_reply     = 1 # replies to commands
+priority_broadcast = 2 # broadcasts and online messages
+
+# outbound message retries
+outbound_max_attempts = 5    # attempts before giving up on a message
+outbound_backoff_base = 1.0  # seconds to wait before the first retry, doubled for each retry after
+outbound_backoff_max  = 60.0 # seconds to wait before a retry, at most
+
+# longest message Discord accepts
+message_max_length = 2000
+
+# member searches, in low-memory mode (without the member cache)
+member_search_limit      = 100                    # members returned per guild for a search (Discord's maximum)
+member_search_cache_size = 256                    # searched names kept, at most (least recently used are dropped first)
+member_search_cache_ttl  = timedelta(minutes = 10) # searched names are searched again after this
+
+# characters of watchers on each page of a watch list, leaving room for titles and the page number
+watch_list_page_length = 1800
+
+# metrics endpoint
+metrics_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0) # latency histogram buckets (seconds)
+
+# event loop watchdog
+watchdog_interval = 0.1 # seconds between heartbeats of the event loop, and checks for a stall
+stall_threshold   = 0.5 # seconds the event loop can be blocked for before its stack is logged
+
+# sampling profiler (!profile)
+profile_interval    = 0.005                       # seconds between samples of the event loop's stack
+profile_seconds     = 10                          # seconds to profile for, unless given
+profile_seconds_max = 60                          # seconds to profile for, at most
+profile_top         = 10                          # hot spots posted (every hot spot is saved to the profile file)
+profile_file        = 'profile-%Y%m%d-%H%M%S.txt' # profile file name (strftime format)
+
+
+#==[ CONFIG FILE ]=========================================================================================================================
+
+# read the JSON config file, if there is one
+#   NOTE: only the settings in the file are returned, converted the same way as the other sources of settings
+#   raises OSError or ValueError (a json.JSONDecodeError) if the file can't be read
+def read_config(path = config_file):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as json_config_file:
+        config = json.load(json_config_file)
+
+    if 'watchers' in config and not all(config['watchers']):
+        del config['watchers']
+
+    if 'coalesce' in config:
+        config['coalesce'] = float(config['coalesce'])
+
+    if 'notice' in config:
+        config['notice']   = int(config['notice'])
+
+    if 'machines' in config:
+        # machines may be given as just a GPIO pin, or a dict of settings
+        config['machines'] = { name: machine if isinstance(machine, dict) else { 'gpiopin': int(machine) }
+                               for name, machine in config['machines'].items() }
+
+    if 'guilds' in config:
+        # JSON keys are strings, guilds are looked up by their (integer) IDs
+        config['guilds']   = { int(guild_id): guild for guild_id, guild in config['guilds'].items() }
+
+    if 'shards' in config:
+        config['shards']   = parse_shards(config['shards'])
+    return config
+
+# parse the number of shards, as a number or "auto" (as many as Discord recommends)
+#   returns None for a single connection without sharding, "auto", or a number of shards
+def parse_shards(value):
+    if value is None or str(value).strip().lower() in ('', '0', 'none', 'off'):
+        return None
+    if str(value).strip().lower() == 'auto':
+        return 'auto'
+    shards = int(value)
+    if shards < 1:
+        raise ValueError(f'Shards must be "auto" or a number from 1 up: {value}')
+    return shards
+
+# get when a file was last modified, or None if it doesn't exist
+def file_modified(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+#==[ PROFILE CACHE ]=======================================================================================================================
+
+# load cached user profiles from disk
+#   format: { user id: { 'user': raw user data, 'fetched': unix timestamp } }
+def load_profiles(path = profile_cache_file):
+    profiles = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as profiles_file:
+                profiles = json.load(profiles_file)
+        except (OSError, ValueError) as e:
+            logger.warning('Unable to load profile cache %s: %s', path, e)
+    return profiles
+
+# save cached user profiles to disk
+#   NOTE: written to a temporary file first, so a crash never leaves a partial cache
+def save_profiles(profiles, path = profile_cache_file):
+    temp_path = f'{path}.tmp'
+    try:
+        with open(temp_path, 'w') as profiles_file:
+            json.dump(profiles, profiles_file)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning('Unable to save profile cache %s: %s', path, e)
+    return
+
+# convert a user to the raw data discord.py builds users from
+def user_to_profile(user):
+    return {
+        'id':            str(user.id),
+        'username':      user.name,
+        'discriminator': user.discriminator,
+        'avatar':        user.avatar,
+        'bot':           user.bot,
+    }
+
+
+#==[ WATCHER STORE ]=======================================================================================================================
+
+# open (and create if needed) the durable watcher store
+#   NOTE: WAL journaling with full syncs keeps every committed add/remove
+#       intact across power loss, and never leaves a half-written store
+def open_watcher_store(path = watcher_store_file):
+    store = sqlite3.connect(path)
+    store.execute('PRAGMA journal_mode = WAL')
+    store.execute('PRAGMA synchronous = FULL')
+    with store:
+        store.execute('CREATE TABLE IF NOT EXISTS watchers ('
+                      '    machine  TEXT    NOT NULL,'
+                      '    user_id  TEXT    NOT NULL,'
+                      '    watching INTEGER NOT NULL,'
+                      '    updated  REAL    NOT NULL,'
+                      '    PRIMARY KEY (machine, user_id)'
+                      ')')
+    return store
+
+# load every watcher the store knows about, in a single read
+#   format: { machine name: { user id: watching (bool) } }
+#   NOTE: removed watchers are kept (watching = False), so watchers from
+#       the config aren't added back after they've removed themselves
+def load_watchers(store):
+    watchers = {}
+    for machine, user_id, watching in store.execute('SELECT machine, user_id, watching FROM watchers'):
+        watchers.setdefault(machine, {})[user_id] = bool(watching)
+    return watchers
+
+# write watchers of a machine through to the store, in a single transaction
+def store_watchers(store, machine, user_ids, watching = True):
+    now = time.time()
+    with store:
+        store.executemany('INSERT OR REPLACE INTO watchers (machine, user_id, watching, updated) VALUES (?, ?, ?, ?)',
+                          [ (machine, str(user_id), int(watching), now) for user_id in user_ids ])
+    return
+
+
+#==[ OUTBOX ]==============================================================================================================================
+
+# open (and create if needed) the outbox of undelivered messages
+#   NOTE: holds one row per recipient of each message, and a row is deleted
+#       as soon as it's delivered, so the outbox only ever holds what's left to send
+#   recipient format: 'channel:<channel name or id>' or 'user:<user id>'
+#   NOTE: used from the database thread (see run_database()), one call at a time, so it isn't tied to the thread that opens it
+def open_outbox(path = outbox_file):
+    outbox = sqlite3.connect(path, check_same_thread = False)
+    outbox.execute('PRAGMA journal_mode = WAL')
+    outbox.execute('PRAGMA synchronous = FULL')
+    with outbox:
+        outbox.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                       '    message_id INTEGER NOT NULL,'
+                       '    recipient  TEXT    NOT NULL,'
+                       '    message    TEXT    NOT NULL,'
+                       '    created    REAL    NOT NULL,'
+                       '    PRIMARY KEY (message_id, recipient)'
+                       ')')
+    return outbox
+
+# write a message for many recipients to the outbox, in a single transaction
+#   NOTE: also drops messages past the outbox's maximum age and size
+# returns the message ID
+def store_outbox_message(outbox, message, recipients):
+    now = time.time()
+    with outbox:
+        message_id = outbox.execute('SELECT COALESCE(MAX(message_id), 0) + 1 FROM outbox').fetchone()[0]
+        outbox.executemany('INSERT INTO outbox (message_id, recipient, message, created) VALUES (?, ?, ?, ?)',
+                           [ (message_id, recipient, message, now) for recipient in recipients ])
+        expired = outbox.execute('DELETE FROM outbox WHERE created < ?', (now - outbox_max_age.total_seconds(),)).rowcount
+        dropped = outbox.execute('DELETE FROM outbox WHERE rowid NOT IN '
+                                 '(SELECT rowid FROM outbox ORDER BY message_id DESC LIMIT ?)', (outbox_max_rows,)).rowcount
+    if expired or dropped:
+        logger.warning('Dropped %s expired and %s excess undelivered outbox messages', expired, dropped)
+    return message_id
+
+# load every undelivered message from the outbox, in a single read
+#   format: [ (message id, recipient, message, unix time created) ], oldest first
+def load_outbox(outbox):
+    return outbox.execute('SELECT message_id, recipient, message, created FROM outbox ORDER BY message_id').fetchall()
+
+# remove delivered messages from the outbox, in a single transaction
+#   format: [ (message id, recipient) ]
+def remove_outbox_messages(outbox, delivered):
+    with outbox:
+        outbox.executemany('DELETE FROM outbox WHERE message_id = ? AND recipient = ?', delivered)
+    return
+
+
+#==[ HISTORY ]=============================================================================================================================
+
+# open (and create if needed) the history of completed cycles
+#   NOTE: every cycle is appended to `cycles`, and added to the daily rollups in the same transaction,
+#       so stats only ever read the rollups (a row per machine and day, hour, or minute of duration),
+#       never the raw cycles. Days and hours are in the time shown in messages (see to_arizona_time()). A cycle starts when the light goes out (the machine is emptied, or a
+#       new cycle is started) and ends when it's "done", so the first cycle after a restart has no start.
+#   NOTE: used from the database thread (see run_database()), as the outbox is
+def open_history(path = history_file):
+    history = sqlite3.connect(path, check_same_thread = False)
+    history.execute('PRAGMA journal_mode = WAL')
+    with history:
+        history.execute('CREATE TABLE IF NOT EXISTS cycles ('
+                        '    machine  TEXT NOT NULL,'
+                        '    started  REAL,'          # unix time, or NULL if unknown
+                        '    ended    REAL NOT NULL,' # unix time
+                        '    duration REAL'           # seconds, or NULL if unknown
+                        ')')
+        history.execute('CREATE INDEX IF NOT EXISTS cycles_ended ON cycles (ended)')
+        history.execute('CREATE TABLE IF NOT EXISTS daily ('
+                        '    machine  TEXT    NOT NULL,'
+                        '    day      TEXT    NOT NULL,' # YYYY-MM-DD, local time
+                        '    cycles   INTEGER NOT NULL,'
+                        '    timed    INTEGER NOT NULL,' # cycles with a known duration
+                        '    duration REAL    NOT NULL,' # total seconds of the timed cycles
+                        '    PRIMARY KEY (machine, day)'
+                        ')')
+        history.execute('CREATE TABLE IF NOT EXISTS daily_hours ('
+                        '    machine  TEXT    NOT NULL,'
+                        '    day      TEXT    NOT NULL,'
+                        '    hour     INTEGER NOT NULL,' # hour the cycles ended in, local time
+                        '    cycles   INTEGER NOT NULL,'
+                        '    PRIMARY KEY (machine, day, hour)'
+                        ')')
+        history.execute('CREATE TABLE IF NOT EXISTS daily_durations ('
+                        '    machine  TEXT    NOT NULL,'
+                        '    day      TEXT    NOT NULL,'
+                        '    minutes  INTEGER NOT NULL,' # whole minutes the cycles took
+                        '    cycles   INTEGER NOT NULL,'
+                        '    PRIMARY KEY (machine, day, minutes)'
+                        ')')
+        history.execute('CREATE TABLE IF NOT EXISTS estimates ('
+                        '    machine  TEXT    NOT NULL,'
+                        '    bucket   INTEGER NOT NULL,' # time-of-day bucket the cycles started in, or -1 for any time
+                        '    cycles   INTEGER NOT NULL,'
+                        '    mean     REAL    NOT NULL,' # seconds
+                        '    variance REAL    NOT NULL,' # seconds squared
+                        '    PRIMARY KEY (machine, bucket)'
+                        ')')
+    return history
+
+# append a completed cycle to the history, and add it to the daily rollups, in a single transaction
+#   started and ended are datetimes (local time), started may be None if unknown
+#   estimates are any updated duration estimates of the machine, saved in the same transaction
+#       format: { bucket: (cycles, mean, variance) }
+def store_cycle(history, machine, started, ended, estimates = None):
+    local    = to_arizona_time(ended)
+    day      = local.strftime('%Y-%m-%d')
+    duration = (ended - started).total_seconds() if started else None
+    with history:
+        history.execute('INSERT INTO cycles (machine, started, ended, duration) VALUES (?, ?, ?, ?)',
+                        (machine, started.timestamp() if started else None, ended.timestamp(), duration))
+        history.execute('INSERT INTO daily (machine, day, cycles, timed, duration) VALUES (?, ?, 1, ?, ?) '
+                        'ON CONFLICT (machine, day) DO UPDATE SET '
+                        '    cycles = cycles + 1, timed = timed + excluded.timed, duration = duration + excluded.duration',
+                        (machine, day, int(duration is not None), duration or 0.0))
+        history.execute('INSERT INTO daily_hours (machine, day, hour, cycles) VALUES (?, ?, ?, 1) '
+                        'ON CONFLICT (machine, day, hour) DO UPDATE SET cycles = cycles + 1',
+                        (machine, day, local.hour))
+        if duration is not None:
+            history.execute('INSERT INTO daily_durations (machine, day, minutes, cycles) VALUES (?, ?, ?, 1) '
+                            'ON CONFLICT (machine, day, minutes) DO UPDATE SET cycles = cycles + 1',
+                            (machine, day, int(duration // 60)))
+        history.executemany('INSERT OR REPLACE INTO estimates (machine, bucket, cycles, mean, variance) VALUES (?, ?, ?, ?, ?)',
+                            [ (machine, bucket, *estimate) for bucket, estimate in (estimates or {}).items() ])
+    return
+
+# load the most recent cycles of some machines
+#   format: [ (machine, started datetime or None, ended datetime, duration seconds or None) ], newest first
+def load_cycles(history, machines, limit = 10):
+    rows = history.execute(f'SELECT machine, started, ended, duration FROM cycles '
+                           f'WHERE machine IN ({", ".join("?" * len(machines))}) ORDER BY ended DESC LIMIT ?',
+                           (*machines, limit)).fetchall()
+    return [ (machine, datetime.fromtimestamp(started) if started else None, datetime.fromtimestamp(ended), duration)
+             for machine, started, ended, duration in rows ]
+
+# count the cycles of some machines since a day (a date), from the daily rollups
+def count_cycles(history, machines, since):
+    return history.execute(f'SELECT COALESCE(SUM(cycles), 0) FROM daily '
+                           f'WHERE machine IN ({", ".join("?" * len(machines))}) AND day >= ?',
+                           (*machines, since.isoformat())).fetchone()[0]
+
+# get the stats of some machines since a day (a date), from the daily rollups
+#   format: {
+#       'cycles':      cycles,
+#       'average':     average seconds per cycle, or None,
+#       'percentiles': { 0.5: minutes, 0.9: minutes } (empty without timed cycles),
+#       'hours':       [ (hour, cycles) ], busiest first,
+#   }
+def load_stats(history, machines, since):
+    where     = f'machine IN ({", ".join("?" * len(machines))}) AND day >= ?'
+    arguments = (*machines, since.isoformat())
+
+    cycles, timed, duration = history.execute(f'SELECT COALESCE(SUM(cycles), 0), COALESCE(SUM(timed), 0), COALESCE(SUM(duration), 0) '
+                                              f'FROM daily WHERE {where}', arguments).fetchone()
+    hours     = history.execute(f'SELECT hour, SUM(cycles) AS total FROM daily_hours WHERE {where} '
+                                f'GROUP BY hour ORDER BY total DESC, hour', arguments).fetchall()
+    durations = history.execute(f'SELECT minutes, SUM(cycles) FROM daily_durations WHERE {where} '
+                                f'GROUP BY minutes ORDER BY minutes', arguments).fetchall()
+
+    # walk the histogram of durations once, for every percentile
+    percentiles = {}
+    seen        = 0
+    for minutes, count in durations:
+        seen += count
+        for fraction in (0.5, 0.9):
+            if fraction not in percentiles and seen >= fraction * timed:
+                percentiles[fraction] = minutes
+    return {
+        'cycles':      cycles,
+        'average':     duration / timed if timed else None,
+        'percentiles': percentiles,
+        'hours':       hours,
+    }
+
+# load the duration estimates of every machine
+#   format: { machine: { bucket: (cycles, mean, variance) } }
+def load_estimates(history):
+    estimates = {}
+    for machine, bucket, cycles, mean, variance in history.execute('SELECT machine, bucket, cycles, mean, variance FROM estimates'):
+        estimates.setdefault(machine, {})[bucket] = (cycles, mean, variance)
+    return estimates
+
+# get the time-of-day bucket a cycle started in, for its duration estimate
+def estimate_bucket(started):
+    return to_arizona_time(started).hour // estimate_bucket_hours
+
+# add a cycle's duration to an estimate, returning the updated estimate
+#   format: (cycles, mean seconds, variance seconds squared), or None for an empty estimate
+#   NOTE: only the estimate itself is kept, never the past durations. It's an exact mean and variance
+#       for the first 1 / estimate_weight cycles, then exponentially weighted,
+#       so it follows a machine whose cycles change (a different setting, a replaced machine)
+def update_estimate(estimate, duration):
+    cycles, mean, variance = estimate or (0, 0.0, 0.0)
+    weight   = max(1 / (cycles + 1), estimate_weight)
+    delta    = duration - mean
+    mean    += weight * delta
+    variance = (1 - weight) * (variance + weight * delta * delta)
+    return (cycles + 1, mean, variance)
+
+
+#==[ METRICS ]=============================================================================================================================
+
+# make an empty latency histogram
+#   format: [ count for each bucket in metrics_buckets, count above the last bucket, total seconds ]
+#   NOTE: a flat list, so observing a latency only updates two of its items in place
+def new_histogram():
+    return [ 0 ] * (len(metrics_buckets) + 1) + [ 0.0 ]
+
+# add a latency (in seconds) to a histogram
+#   NOTE: only called on the event loop, so histograms need no locks
+def observe(histogram, seconds):
+    histogram[bisect.bisect_left(metrics_buckets, seconds)] += 1
+    histogram[-1] += seconds
+    return
+
+# render metrics in the Prometheus text format
+#   format of metrics: [ (name, type, help, value) ], where the value of a histogram is a histogram from new_histogram()
+def render_metrics(metrics):
+    lines = []
+    for name, kind, description, value in metrics:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            total = 0
+            for bound, count in zip(metrics_buckets + (None,), value):
+                total += count
+                lines.append(f'{name}_bucket{{le="{bound if bound is not None else "+Inf"}"}} {total}')
+            lines.append(f'{name}_sum {value[-1]}')
+            lines.append(f'{name}_count {total}')
+        else:
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+#==[ PROFILER ]============================================================================================================================
+
+# sample the stack of a thread every profile_interval seconds, for a number of seconds
+#   NOTE: runs on a thread of its own, and only reads the sampled thread's frames,
+#       so the sampled thread doesn't slow down any more than the GIL makes it.
+#       Samples where the thread is waiting in selectors (an idle event loop) are only counted,
+#       and functions are only counted up to the event loop running a callback, not the loop itself.
+#   returns {
+#       'samples': samples taken,
+#       'idle':    samples where the thread was idle,
+#       'lines':   { (file, line, function): samples running that line },
+#       'calls':   { (file, function): samples with that function anywhere on the stack },
+#   }
+def sample_stack(thread_id, seconds):
+    profile  = { 'samples': 0, 'idle': 0, 'lines': {}, 'calls': {} }
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame:
+            profile['samples'] += 1
+            code = frame.f_code
+            if code.co_name == 'select' and code.co_filename.endswith('selectors.py'):
+                profile['idle'] += 1
+            else:
+                line = (code.co_filename, frame.f_lineno, code.co_name)
+                profile['lines'][line] = profile['lines'].get(line, 0) + 1
+                seen = set()
+                while frame and not frame.f_code.co_filename.endswith(os.path.join('asyncio', 'events.py')):
+                    call = (frame.f_code.co_filename, frame.f_code.co_name)
+                    if call not in seen:
+                        seen.add(call)
+                        profile['calls'][call] = profile['calls'].get(call, 0) + 1
+                    frame = frame.f_back
+        frame = None
+        time.sleep(profile_interval)
+    return profile
+
+# render a profile from sample_stack() as text, with its hot spots busiest first
+#   top limits how many hot spots are listed (None lists all of them), and full keeps the full paths of files
+def format_profile(profile, seconds, top = None, full = False):
+    samples = profile['samples'] or 1
+    name    = (lambda path: path) if full else os.path.basename
+    lines   = [ f'{profile["samples"]} samples over {seconds}s, {100 * profile["idle"] / samples:.1f}% idle',
+                '',
+                'Busiest lines:' ]
+    for (path, line, function), count in sorted(profile['lines'].items(), key = lambda item: -item[1])[:top]:
+        lines.append(f'{100 * count / samples:5.1f}% {name(path)}:{line} ({function})')
+    lines += [ '', 'Busiest functions (including what they call):' ]
+    for (path, function), count in sorted(profile['calls'].items(), key = lambda item: -item[1])[:top]:
+        lines.append(f'{100 * count / samples:5.1f}% {name(path)} {function}')
+    return '\n'.join(lines) + '\n'
+
+
+#==[ STARTUP ]=============================================================================================================================
+
+# startup runs in phases, each timed for the startup profile:
+#   import: the modules at the top of this file
+#   config: the config file, environment variables and command line, and the stores
+#   gpio:   gpiozero imported, and the sensors armed (edges are queued from here on, and handled once ready)
+#   client: discord imported, and the client built
+#   login:  logged in, and connected to the gateway (or logged in over REST only, in notifier mode)
+#   ready:  the gateway's READY (not in notifier mode)
+#   format: [ (phase name, time.monotonic() it ended) ]
+startup_phases = []
+
+# end a phase of startup, if it hasn't already ended (on_connect and on_ready are called again on reconnects)
+#   returns whether the phase ended now
+def end_startup_phase(name):
+    if name in [ phase for phase, ended in startup_phases ]:
+        return False
+    startup_phases.append((name, time.monotonic()))
+    return True
+
+# format the startup profile, as a single line with the seconds each phase took
+def format_startup_profile(phases, started = startup_started):
+    if not phases:
+        return 'no phases'
+    times = []
+    for name, ended in phases:
+        times.append(f'{name} {ended - started:.3f}s')
+        started = ended
+    return f'{phases[-1][1] - startup_started:.3f}s total: ' + ', '.join(times)
+
+
+#==[ HELPERS ]=============================================================================================================================
+
+# convert a delay (minutes, or an existing timedelta) to a timedelta
+def to_timedelta(delay):
+    if isinstance(delay, timedelta):
+        return delay
+    return timedelta(minutes = int(delay))
+
+# convert a datetime from the clock (UTC) to the time shown in messages
+def to_arizona_time(time):
+    return time - timedelta(hours = 7) # Arizona is UTC -0700
+
+# format a number of seconds as minutes (or hours and minutes), for messages
+def format_duration(seconds):
+    minutes = round(seconds / 60)
+    if minutes < 60:
+        return f'{minutes} min'
+    return f'{minutes // 60}h {minutes % 60:02}m'
+
+# get the resident memory of this process, in MiB
+#   NOTE: falls back to the peak resident memory where /proc isn't available
+def resident_memory():
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# render a single watcher, as a line of a watch list
+def watcher_line(user_id, user):
+    return f'{user.name if user else user_id} {user_id}\n'
+
+# split a message into messages that fit within Discord's limit, on line breaks where possible
+def split_message(message, length = message_max_length):
+    messages = []
+    while len(message) > length:
+        split = message.rfind('\n', 0, length) + 1 or length
+        messages.append(message[:split])
+        message = message[split:]
+    if message or not messages:
+        messages.append(message)
+    return messages
 
 
 #==[ MAIN ]================================================================================================================================
@@ -57,150 +650,1248 @@ def main(args):
     loglevel = args.loglevel            or logging.INFO
     prefix   = args.prefix              or '!'
     watchers = args.watchers            or []
-    users    = dict.fromkeys(watchers)  or {}
+    concurrency = args.concurrency      or 10
+    machine_configs = args.machines     or { default_machine: {} }
+    detector = args.detector            or None
+    coalesce = args.coalesce if args.coalesce is not None else 5.0
+    lowmemory = args.lowmemory          or False
+    webhook  = args.webhook             or None
+    listen   = args.listen              or None
+    secret   = args.secret              or None
+    notice   = timedelta(minutes = args.notice if args.notice is not None else 10)
+    metrics  = args.metrics             or None
+    record   = args.record              or None
+    startupprofile = args.startupprofile or False
+    guild_configs = args.guilds         or {}
+    shards   = args.shards              or None
+
+    # without a gateway session, the management channel is a webhook
+    if webhook:
+        channel = webhook
     
-
-    # initalize GPIO watching
-    light_sensor = gpiozero.DigitalInputDevice(gpiopin, pull_up = True)
-
-    # datetime since laundry was last done
-    laundry_done_last = datetime.now() - timedelta(days = 365)
-    threshold_delta   = timedelta(minutes = delay)
+    # settings from the config file, to find what changed when it's reloaded
+    config_modified = file_modified(config_file)
+    config          = read_config()
+
+
+    # user profiles cached from previous runs
+    profiles = load_profiles()
+
+    # completion messages not yet delivered, from previous runs
+    outbox = open_outbox()
+
+    # completed cycles, for stats, and estimates of how long cycles take
+    history   = open_history()
+    estimates = load_estimates(history)
+
+    # watchers from previous runs
+    watcher_store  = open_watcher_store()
+    known_watchers = load_watchers(watcher_store)
+
+    # settings of each guild (server) the bot serves, when one bot serves several buildings
+    #   NOTE: a guild has its own management channel, prefix, delay and watchers,
+    #       along with the machines bound to it (each machine to one guild at most)
+    #   format: { guild id: { 'channel': channel name or ID, 'prefix': prefix, 'delay': minutes, 'watchers': [ user IDs ], 'machines': [ machine names ] } }
+    guilds         = {}
+    machine_guilds = {} # format: { machine name: guild id }
+
+    # (re)build the guild index from the guild configs
+    def index_guild_configs():
+        guilds.clear()
+        machine_guilds.clear()
+        for guild_id, guild_config in guild_configs.items():
+            guilds[guild_id] = guild_config
+            for name in guild_config.get('machines') or []:
+                if name not in machine_configs:
+                    logger.warning('Guild %s is bound to an unknown machine: %s', guild_id, name)
+                elif name in machine_guilds:
+                    logger.warning('Machine %s is already bound to guild %s, not to guild %s', name, machine_guilds[name], guild_id)
+                else:
+                    machine_guilds[name] = guild_id
+        return
+    index_guild_configs()
+
+    # the settings of a machine, from its own config, falling back to its guild's settings, then the global settings
+    def machine_settings(name, machine_config):
+        guild_config = guilds.get(machine_guilds.get(name), {})
+        return {
+            'guild':   machine_guilds.get(name),
+            'gpiopin': machine_config.get('gpiopin') or gpiopin,
+            'delay':   to_timedelta(machine_config.get('delay') or guild_config.get('delay') or delay),
+            'channel': (machine_config.get('webhook') or guild_config.get('webhook') or webhook) if webhook else
+                       (machine_config.get('channel') or guild_config.get('channel') or channel),
+        }
+
+    # the watchers of a machine from the config, falling back to its guild's watchers, then the global watchers
+    def machine_watchers(name, machine_config):
+        return machine_config.get('watchers') or guilds.get(machine_guilds.get(name), {}).get('watchers') or watchers
+
+    # machines being watched, each with its own sensor, debounce state, channel and watchers
+    #   NOTE: settings not given for a machine fall back to its guild's settings, then the global settings
+    machines = {}
+    for name, machine_config in machine_configs.items():
+
+        # watchers from previous runs, plus any new watchers from the config
+        known = known_watchers.get(name, {})
+        new   = [ user_id for user_id in machine_watchers(name, machine_config) if user_id and user_id not in known ]
+        store_watchers(watcher_store, name, new)
+
+        users = dict.fromkeys([ user_id for user_id in known if known[user_id] ] + new)
+        machines[name] = {
+            'name':      name,
+            **machine_settings(name, machine_config), # guild, gpiopin, delay and channel
+            'users':     users,
+            'lines':     { user_id: watcher_line(user_id, None) for user_id in users }, # rendered watch list, kept in step with users
+            'pages':     None, # rendered watch list split into pages, or None until next needed
+            'done_last': datetime.now() - timedelta(days = 365), # datetime since laundry was last done
+            'started':   None, # datetime the light last went out (the current cycle started), or None if unknown
+            'estimates': estimates.get(name, {}), # cycle duration estimates, by time-of-day bucket (-1 for any time)
+            'eta':       None, # datetime the current cycle should be done, or None without an estimate
+            'eta_timer': None, # asyncio.TimerHandle of the "done soon" DMs, or None if none are scheduled
+            'sensor':    None,
+            'detector':  None, # signal detector settings, or None to treat every edge as "done"
+        }
+
+        # signal detector settings, merged over the defaults
+        machine_detector = machine_config.get('detector', detector)
+        if machine_detector:
+            machines[name]['detector'] = { **detector_defaults, **(machine_detector if isinstance(machine_detector, dict) else {}) }
+
+    # raw sensor edges recorded for replay.py, when watching GPIO pins (sensor agents record their own)
+    trace = None
+    if record and not listen:
+        try:
+            trace = open_trace(record)
+        except (OSError, ValueError) as e:
+            logger.error('Unable to record sensor edges to %s: %s', record, e)
+
+    # the event loop the client will run on
+    #   NOTE: the sensors are armed before the client exists, so edges are handed to this loop until it runs
+    event_loop = asyncio.get_event_loop()
+
+    # the thread outbox and history calls run on, so syncing a completion to the SD card (or reading stats) never stalls the event loop
+    #   NOTE: a single thread, so each is only ever used by one call at a time, in the order they're made
+    database_executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'database')
+
+    # run a database call on the database thread
+    #   returns a future of its result
+    def run_database(function, *arguments):
+        return event_loop.run_in_executor(database_executor, function, *arguments)
 
     # set log level
     logger.setLevel(loglevel)
 
-    logger.debug(f'All arguments passed to script: {args}')
-    logger.debug(f'token:    {token}')
-    logger.debug(f'channel:  {channel}')
-    logger.debug(f'delay:    {delay}')
-    logger.debug(f'gpiopin:  {gpiopin}')
-    logger.debug(f'loglevel: {loglevel}')
-    logger.debug(f'prefix:   {prefix}')
-    logger.debug(f'watchers: {watchers}')
-    logger.debug(f'users:    {users}')
-
-    # discord client
-    # NOTE: intents are needed to get users by id, 
-    #   this must be set in the Discord Dev Center:
-    #       https://discord.com/developers/applications/ ->
-    #       Application -> Bot -> SERVER MEMBERS INTENT (ON)
-    intents         = discord.Intents.default()
-    intents.members = True
-    #client          = discord.Client(intents = intents)
-    client          = commands.Bot(command_prefix = prefix,
-                                   intents        = intents)
+    logger.debug('All arguments passed to script: %s', args)
+    logger.debug('channel:  %s', channel)
+    logger.debug('delay:    %s', delay)
+    logger.debug('gpiopin:  %s', gpiopin)
+    logger.debug('loglevel: %s', loglevel)
+    logger.debug('prefix:   %s', prefix)
+    logger.debug('watchers: %s', watchers)
+    logger.debug('concurrency: %s', concurrency)
+    logger.debug('detector: %s', detector)
+    logger.debug('coalesce: %s', coalesce)
+    logger.debug('lowmemory: %s', lowmemory)
+    logger.debug('webhook:  %s', bool(webhook))
+    logger.debug('listen:   %s', listen)
+    logger.debug('secret:   %s', bool(secret))
+    logger.debug('notice:   %s', notice)
+    logger.debug('metrics:  %s', metrics)
+    logger.debug('record:   %s', record)
+    logger.debug('machines: %s', machines)
+    logger.debug('guilds:   %s', guilds)
+    logger.debug('shards:   %s', shards)
+    logger.debug('startupprofile: %s', startupprofile)
+    end_startup_phase('config')
 
 
     #--[ CUSTOM FUNCTIONS ]--------------------------------------------------------------------------------------------
 
-    # sets user details for all users
+    # sets user details for all users that don't have them yet
+    #   1. users already in the gateway cache are used as-is
+    #   2. users in the profile cache (and not past the TTL) are rebuilt from it
+    #   3. all remaining users are fetched concurrently, in one batch
     async def set_user_details(users):
-        user = None
-        logger.debug(f'users: {users}')
-        for index, user_id in enumerate(users):
-            logger.debug(f'user id: {user_id}')
-            if user_id in users:
-                logger.debug( 'user id in users')
-                logger.debug(f'users[user_id]: {users[user_id]}')
-                logger.debug(f'bool:           {bool(users[user_id])}')
-                if not users[user_id]:
+        logger.debug('users: %s', users)
+        pending = [ user_id for user_id in users if not users[user_id] ]
+        logger.debug('users without details: %s', pending)
+        if not pending:
+            return users
+
+        now     = time.time()
+        missing = []
+        for user_id in pending:
+            user = client.get_user(int(user_id)) if str(user_id).isdecimal() else None
+            if user:
+                logger.debug('user found in gateway cache: %s', user)
+                profiles[user_id] = { 'user': user_to_profile(user), 'fetched': now }
+            else:
+                profile = profiles.get(user_id)
+                if profile and now - profile['fetched'] < profile_cache_ttl.total_seconds():
+                    logger.debug('user found in profile cache: %s', profile)
+                    user = client._connection.store_user(profile['user'])
+            if user:
+                users[user_id] = user
+            else:
+                missing.append(user_id)
+
+        # fetch all remaining users at once, within the concurrency window
+        window = asyncio.Semaphore(concurrency)
+
+        async def fetch_user_in_window(user_id):
+            async with window:
+                try:
                     user = await client.fetch_user(user_id)
-                    if(user):
-                        logger.debug(f'acquired user details: {user}')
-                        users[user_id] = user
-                    else:
-                        logger.error('unable to acquire user by user_id')
-                else:
-                    logger.debug('user already set')
+                except discord.HTTPException as e:
+                    logger.error('unable to acquire user by user_id %s: %s', user_id, e)
+                    return
+            logger.debug('acquired user details: %s', user)
+            users[user_id]    = user
+            profiles[user_id] = { 'user': user_to_profile(user), 'fetched': now }
+            return
+
+        if missing:
+            logger.info('Fetching details for %s users', len(missing))
+            await asyncio.gather(*[ fetch_user_in_window(user_id) for user_id in missing ])
+
+        save_profiles(profiles)
         return users
 
+    #--[ OUTBOUND ]----------------------------------------------------------------------------------------------------
+
+    # every message the bot sends goes through here:
+    #   1. messages are queued per destination (channel or user), in priority order,
+    #       and identical messages already waiting for the same destination are only sent once
+    #   2. each destination sends one message at a time, so its messages stay in order
+    #   3. across destinations, no more than `concurrency` messages are sent at once,
+    #       and when all of those slots are taken, the highest priority message gets the next one
+    #   4. 429s, 5xx errors, and connection errors are retried with jittered exponential backoff,
+    #       waiting at least as long as Discord's Retry-After
+    #   5. alerts and broadcasts are coalesced: the first one to a destination is sent right away,
+    #       any more within `coalesce` seconds are held until the window ends and merged into one digest message
+
+    # outbound messages waiting to be sent
+    #   format: { destination key: [ (priority, sequence, entry) ] } (heap)
+    outbound_queues   = {}
+    outbound_workers  = {} # format: { destination key: task draining its queue }
+    outbound_pending  = {} # format: { (destination key, message): entry }, for dedupe
+    outbound_wakeups  = {} # format: { destination key: event set when a message is queued }
+    outbound_digests  = {} # format: { destination key: entry still open to more messages }
+    outbound_windows  = {} # format: { destination key: monotonic time the last digest was sent }
+    outbound_slots    = concurrency
+    outbound_waiters  = [] # format: [ (priority, sequence, future) ] (heap)
+    outbound_sequence = itertools.count()
+    outbound_stats    = {
+        'queued':    0, # messages queued
+        'deduped':   0, # messages that were already waiting to be sent
+        'coalesced': 0, # messages merged into a digest already waiting to be sent
+        'sent':      0, # messages sent
+        'failed':    0, # messages given up on
+        'retries':   0, # attempts after the first
+    }
+
+    # get the key messages for a destination are queued by
+    def destination_key(destination):
+        if isinstance(destination, commands.Context):
+            destination = destination.channel
+        if isinstance(destination, (discord.User, discord.Member)):
+            return ('user', destination.id)
+        return ('channel', destination.id)
+
+    # get the number of messages waiting to be sent
+    def outbound_queue_depth():
+        return sum(len(outbound_queue) for outbound_queue in outbound_queues.values())
+
+    # wait for one of the `concurrency` slots for sending messages
+    async def acquire_outbound_slot(priority):
+        nonlocal outbound_slots
+        if outbound_slots > 0 and not outbound_waiters:
+            outbound_slots -= 1
+            return
+        waiter = client.loop.create_future()
+        heapq.heappush(outbound_waiters, (priority, next(outbound_sequence), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # a slot handed over right as the wait was cancelled must be passed on
+            if waiter.done() and not waiter.cancelled():
+                release_outbound_slot()
+            raise
+        return
+
+    # hand a slot for sending messages to the highest priority waiter, or free it
+    def release_outbound_slot():
+        nonlocal outbound_slots
+        while outbound_waiters:
+            priority, sequence, waiter = heapq.heappop(outbound_waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        outbound_slots += 1
+        return
+
+    # get how long to wait before retrying a failed send
+    def outbound_backoff(attempt, error):
+        backoff = min(outbound_backoff_max, outbound_backoff_base * 2 ** (attempt - 1))
+        backoff = backoff * random.uniform(0.5, 1.5) # jitter, so retries don't line up
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                backoff = max(backoff, float(response.headers.get('Retry-After', 0)))
+            except (TypeError, ValueError):
+                pass
+        return backoff
+
+    # send a single queued message, retrying transient failures
+    async def deliver_outbound(entry):
+        for attempt in range(1, outbound_max_attempts + 1):
+            await acquire_outbound_slot(entry['priority'])
+            try:
+                if attempt == 1:
+                    observe(latency_histograms['queue'], time.monotonic() - entry['queued'])
+                else:
+                    outbound_stats['retries'] += 1
+                await entry['destination'].send(entry['message'])
+                outbound_stats['sent'] += 1
+                return None
+            except discord.HTTPException as e:
+                # only rate limits and server errors are worth retrying
+                error = e
+                if e.status != 429 and e.status < 500:
+                    break
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                error = e
+            except Exception as e:
+                # anything else (a malformed response, or a bug) won't go away by retrying
+                logger.error('Sending to %s failed: %s', entry['destination'], e, exc_info = True)
+                error = e
+                break
+            finally:
+                release_outbound_slot()
+
+            if attempt < outbound_max_attempts:
+                backoff = outbound_backoff(attempt, error)
+                logger.warning('Sending to %s failed (attempt %s/%s), retrying in %.1fs: %s',
+                               entry['destination'], attempt, outbound_max_attempts, backoff, error)
+                await asyncio.sleep(backoff)
+
+        outbound_stats['failed'] += 1
+        return error
+
+    # send the messages queued for a destination, one at a time, in priority order
+    #   NOTE: digests held for their coalescing window are skipped until the window ends
+    async def drain_outbound_queue(key):
+        outbound_queue = outbound_queues[key]
+        wakeup         = outbound_wakeups[key]
+        try:
+            while outbound_queue:
+                now = time.monotonic()
+                due = [ item for item in outbound_queue if item[2]['not_before'] <= now ]
+                if not due:
+                    # wait for the first window to end, or for something new to be queued
+                    wakeup.clear()
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), min(item[2]['not_before'] for item in outbound_queue) - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                item = min(due)
+                outbound_queue.remove(item)
+                heapq.heapify(outbound_queue)
+                priority, sequence, entry = item
+                for message in entry['messages']:
+                    outbound_pending.pop((key, message), None)
+                if outbound_digests.get(key) is entry:
+                    del outbound_digests[key]
+                    outbound_windows[key] = now
+                error = await deliver_outbound(entry)
+                if not entry['future'].done():
+                    if error:
+                        entry['future'].set_exception(error)
+                    else:
+                        entry['future'].set_result(None)
+        finally:
+            # if the worker ended any other way (cancelled, or a bug), fail whatever is left,
+            #   so nothing waits on it forever
+            for priority, sequence, entry in outbound_queue:
+                for message in entry['messages']:
+                    outbound_pending.pop((key, message), None)
+                if outbound_digests.get(key) is entry:
+                    del outbound_digests[key]
+                if not entry['future'].done():
+                    entry['future'].set_exception(RuntimeError(f'Stopped sending to {entry["destination"]}'))
+
+            # the next message queued for the destination starts a new worker
+            #   NOTE: no awaits between the empty check and here, so nothing can be queued in between
+            del outbound_queues[key]
+            del outbound_workers[key]
+            del outbound_wakeups[key]
+            if outbound_windows.get(key, 0) + coalesce <= time.monotonic():
+                outbound_windows.pop(key, None) # window is over, nothing left to hold back
+        return
+
+    # queue a message to a destination (channel, user, or command context), and wait for it to be sent
+    #   raises the last error if the message couldn't be sent
+    #   NOTE: replies are never coalesced, so commands are always answered right away
+    async def queue_message(destination, message, priority = priority_reply):
+        key = destination_key(destination)
+        coalescing = coalesce > 0 and priority != priority_reply
+
+        # an identical message is already waiting for this destination, wait on that one instead
+        entry = outbound_pending.get((key, message))
+        if entry:
+            outbound_stats['deduped'] += 1
+            logger.debug('already queued for %s: %s', destination, message)
+            return await asyncio.shield(entry['future'])
+
+        # a digest is still waiting for this destination, add to it if there's room
+        entry = outbound_digests.get(key) if coalescing else None
+        if entry and len(entry['message']) + 1 + len(message) <= message_max_length:
+            entry['messages'].append(message)
+            entry['message'] += '\n' + message
+            outbound_pending[(key, message)] = entry
+            if priority < entry['priority']:
+                outbound_queue = outbound_queues[key]
+                for index, item in enumerate(outbound_queue):
+                    if item[2] is entry:
+                        outbound_queue[index] = (priority, item[1], entry)
+                heapq.heapify(outbound_queue)
+                entry['priority'] = priority
+            outbound_stats['coalesced'] += 1
+            logger.debug('coalesced for %s: %s', destination, message)
+            return await asyncio.shield(entry['future'])
+
+        now   = time.monotonic()
+        entry = {
+            'destination': destination,
+            'message':     message,
+            'messages':    [ message ], # every message merged into this one, for dedupe
+            'priority':    priority,
+            'queued':      now,
+            'not_before':  now,
+            'future':      client.loop.create_future(),
+        }
+        if coalescing:
+            # the first digest in a window goes out right away, the next waits for the window to end
+            entry['not_before'] = max(now, outbound_windows.get(key, now - coalesce) + coalesce)
+            outbound_digests[key] = entry
+        outbound_pending[(key, message)] = entry
+        heapq.heappush(outbound_queues.setdefault(key, []), (priority, next(outbound_sequence), entry))
+        outbound_stats['queued'] += 1
+        if key in outbound_wakeups:
+            outbound_wakeups[key].set()
+        else:
+            outbound_wakeups[key] = asyncio.Event()
+        if key not in outbound_workers:
+            outbound_workers[key] = client.loop.create_task(drain_outbound_queue(key))
+        logger.debug('queued for %s (priority %s, queue depth %s): %s', destination, priority, outbound_queue_depth(), message)
+        return await asyncio.shield(entry['future'])
+
     # send DM to a single user
-    async def send_dm(user, message = 'test message'):
-        logger.debug(f'sending DM to: {user}')
-        logger.debug(f'message:       {message}')
-        await user.send(message)
+    async def send_dm(user, message = 'test message', priority = priority_reply):
+        logger.debug('sending DM to: %s', user)
+        logger.debug('message:       %s', message)
+        start = time.monotonic()
+        await queue_message(user, message, priority)
+        observe(latency_histograms['dm'], time.monotonic() - start)
         return
 
     # send DMs to many users
-    async def send_dms(users, message = 'test message'):
+    #   NOTE: DMs are queued all at once, the outbound queue limits how many are sent at a time
+    #   returns a dict of user_id -> (latency in seconds, error or None)
+    async def send_dms(users, message = 'test message', priority = priority_broadcast):
         logger.debug( 'sending DMs to many users')
-        logger.debug(f'users: {users}')
-        for index, user_id in enumerate(users):
-            await send_dm(users[user_id], message)
+        logger.debug('users: %s', users)
+
+        results = {}
+
+        # send a single DM, recording how long it took and why it failed (if it did)
+        async def send_dm_with_result(user_id, user):
+            error = None
+            start = time.perf_counter()
+            try:
+                if not user:
+                    error = 'user details not set'
+                else:
+                    await send_dm(user, message, priority)
+            except discord.Forbidden:
+                # user has DMs closed or has blocked the bot
+                error = 'DMs are closed'
+            except discord.HTTPException as e:
+                error = f'HTTP {e.status}: {e.text}'
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                error = repr(e)
+            latency = time.perf_counter() - start
+            results[user_id] = (latency, error)
+            if error:
+                logger.warning('Unable to send DM to %s: %s', user or user_id, error)
+            else:
+                logger.debug('sent DM to %s in %.3fs', user, latency)
+            return
+
+        start = time.perf_counter()
+        await asyncio.gather(*[ send_dm_with_result(user_id, users[user_id]) for user_id in list(users) ])
+        elapsed = time.perf_counter() - start
+
+        failures = [ user_id for user_id in results if results[user_id][1] ]
+        if results:
+            latencies = sorted(latency for latency, error in results.values())
+            logger.info('Sent DMs to %s/%s users in %.3fs (max latency: %.3fs)',
+                        len(results) - len(failures), len(results), elapsed, latencies[-1])
+        if failures:
+            logger.warning('Failed to send DMs to: %s', failures)
+        return results
+
+    # index of text channel names to channels, for every guild the bot is in
+    #   NOTE: kept current by the guild and channel events below,
+    #       so lookups never have to walk client.get_all_channels()
+    #   format: { channel name: { channel id: channel } }
+    channels_by_name = {}
+
+    # add a single channel to the index
+    def index_channel(channel_obj):
+        if isinstance(channel_obj, discord.TextChannel):
+            channels_by_name.setdefault(channel_obj.name, {})[channel_obj.id] = channel_obj
+        return
+
+    # remove a single channel from the index
+    def unindex_channel(channel_obj):
+        same_name = channels_by_name.get(channel_obj.name)
+        if same_name:
+            same_name.pop(channel_obj.id, None)
+            if not same_name:
+                del channels_by_name[channel_obj.name]
+        return
+
+    # add all channels of a guild to the index
+    def index_guild(guild):
+        for channel_obj in guild.text_channels:
+            index_channel(channel_obj)
+        return
+
+    # remove all channels of a guild from the index
+    def unindex_guild(guild):
+        for channel_obj in guild.text_channels:
+            unindex_channel(channel_obj)
+        return
+
+    # webhooks by URL, in notifier mode
+    #   NOTE: they share the connection pool of the REST client, see start_notifier()
+    webhooks        = {}
+    webhook_session = None
+
+    # get a webhook by its URL
+    def get_webhook(url):
+        if url not in webhooks:
+            webhooks[url] = discord.Webhook.from_url(url, adapter = discord.AsyncWebhookAdapter(webhook_session))
+        return webhooks[url]
+
+    # get a channel by its name, or by its ID if the name is numeric
+    #   NOTE: in notifier mode, channels are webhook URLs.
+    #       A name given as "guild id/channel name" is only looked up in that guild,
+    #       any other name only in the guilds without settings (a guild with settings only gets its own machines' messages)
+    def get_channel_by_name(name):
+        if webhook:
+            return get_webhook(name)
+        if str(name).isdecimal():
+            return client.get_channel(int(name))
+        guild_id, separator, name = str(name).rpartition('/')
+        same_name = channels_by_name.get(name)
+        if same_name and separator:
+            return next((channel_obj for channel_obj in same_name.values() if channel_obj.guild.id == int(guild_id)), None)
+        if same_name:
+            # first indexed channel with that name
+            return next((channel_obj for channel_obj in same_name.values() if channel_obj.guild.id not in guilds), None)
+        return None
+
+    # get the management channel of a guild, for get_channel_by_name()
+    #   NOTE: without a guild (for machines not bound to one), it's the global management channel,
+    #       looked up in the guilds without settings
+    def guild_channel(guild_id, name = None):
+        name = name or guilds.get(guild_id, {}).get('webhook' if webhook else 'channel') or channel
+        if guild_id and not webhook and not str(name).isdecimal():
+            return f'{guild_id}/{name}'
+        return name
+
+    # get every management channel: the global one, and that of each guild
+    def management_channels():
+        return list(dict.fromkeys([ channel, *[ guild_channel(guild_id) for guild_id in guilds ] ]))
+
+    # indexes of member names to members, for every guild the bot is in
+    #   NOTE: kept current by the member events below,
+    #       so lookups never have to walk client.get_all_members()
+    #   format: { name: { user id: member } }
+    members_by_name        = {} # exact usernames
+    members_by_folded_name = {} # case-insensitive usernames and nicknames
+
+    # get the (index, key) pairs a member is indexed by
+    def member_keys(member):
+        keys = [ (members_by_name, member.name), (members_by_folded_name, member.name.casefold()) ]
+        nick = getattr(member, 'nick', None)
+        if nick:
+            keys.append((members_by_folded_name, nick.casefold()))
+        return keys
+
+    # add a single member to the indexes
+    def index_member(member):
+        for index, key in member_keys(member):
+            index.setdefault(key, {})[member.id] = member
+        return
+
+    # remove a single member from the indexes
+    def unindex_member(member):
+        for index, key in member_keys(member):
+            same_name = index.get(key)
+            if same_name:
+                same_name.pop(member.id, None)
+                if not same_name:
+                    del index[key]
+        return
+
+    # remove stale entries for a user, then re-index them from every guild they are still in
+    #   NOTE: a user can be a member of several guilds, with a different nickname in each
+    def reindex_user(user_id, *stale):
+        for member in stale:
+            unindex_member(member)
+        for guild in client.guilds:
+            member = guild.get_member(user_id)
+            if member:
+                index_member(member)
         return
 
+    # get a member by username, falling back to case-insensitive usernames and nicknames
+    def get_member_by_name(username):
+        same_name = members_by_name.get(username) or members_by_folded_name.get(username.casefold())
+        if same_name:
+            # first indexed member with that name
+            return next(iter(same_name.values()))
+        return None
+
+    # members found by searching for a name, in low-memory mode
+    #   NOTE: kept in least recently used order, names that weren't found are kept too
+    #   format: { case-insensitive name: (monotonic time searched, member or None) }
+    member_search_cache = {}
+
+    # search every guild for a member by username, falling back to case-insensitive usernames and nicknames
+    #   NOTE: used in low-memory mode, where there are no member indexes to look in
+    async def search_member_by_name(username):
+        key   = username.casefold()
+        found = member_search_cache.pop(key, None)
+        if found and time.monotonic() - found[0] < member_search_cache_ttl.total_seconds():
+            member_search_cache[key] = found # now the most recently used
+            return found[1]
+
+        exact  = None
+        folded = None
+        for guild in client.guilds:
+            try:
+                members = await guild.query_members(query = username, limit = member_search_limit, cache = False)
+            except asyncio.TimeoutError:
+                logger.warning('Timed out searching %s for members named %s', guild, username)
+                continue
+            exact  = exact  or next((member for member in members if member.name == username), None)
+            folded = folded or next((member for member in members
+                                     if key in (member.name.casefold(), (member.nick or '').casefold())), None)
+            if exact:
+                break
+
+        member_search_cache[key] = (time.monotonic(), exact or folded)
+        while len(member_search_cache) > member_search_cache_size:
+            del member_search_cache[next(iter(member_search_cache))]
+        return exact or folded
+
     # send message to specific channel
-    async def send_channel_message(name = channel, message = 'test message'):
-        logger.debug(f'channel name: {name}')
-        channel_obj = discord.utils.get(client.get_all_channels(), name = name)
+    #   NOTE: the management channel is looked up when called, since reloading the config can change it
+    async def send_channel_message(name = None, message = 'test message', priority = priority_reply):
+        name = name or channel
+        logger.debug('channel name: %s', name)
+        channel_obj = get_channel_by_name(name)
         if channel_obj:
-            logger.debug(f'channel:    {channel_obj}')
-            logger.debug(f'channel.id: {channel_obj.id}')
-            logger.info( f'Sending message to #{channel_obj}: {message}')
-            await channel_obj.send(message)
+            logger.debug('channel:    %s', channel_obj)
+            logger.debug('channel.id: %s', channel_obj.id)
+            logger.info( 'Sending message to #%s: %s', channel_obj, message)
+            await queue_message(channel_obj, message, priority)
+        return
+
+    # get all watchers of every machine (or of some machines)
+    #   format: { user id: user }
+    def get_all_users(names = None):
+        all_users = {}
+        for name in machines if names is None else names:
+            for user_id, user in machines[name]['users'].items():
+                all_users[user_id] = all_users.get(user_id) or user
+        return all_users
+
+    # sets user details for the watchers of every machine, in one batch
+    async def set_all_user_details():
+        all_users = await set_user_details(get_all_users())
+        for machine in machines.values():
+            for user_id in machine['users']:
+                set_watcher(machine, user_id, all_users[user_id])
+        return all_users
+
+    # get the machines a command can target: those bound to the guild it was sent in (if the guild has settings),
+    #   otherwise (in a DM, or a guild without settings) those bound to no guild, and those of the guilds the author is a member of
+    #   NOTE: so nobody can list, message or subscribe to the watchers of a guild they aren't in.
+    #       Membership is looked up in the member cache, so in low memory mode (without it) only machines bound to no guild are targeted
+    def command_machines(ctx):
+        if ctx.guild and ctx.guild.id in guilds:
+            return [ name for name in machines if machine_guilds.get(name) == ctx.guild.id ]
+        member_of = { guild_id for guild_id in guilds
+                      if client.get_guild(guild_id) and client.get_guild(guild_id).get_member(ctx.author.id) }
+        return [ name for name in machines if machine_guilds.get(name) is None or machine_guilds[name] in member_of ]
+
+    # split command arguments into the machines they target and the remaining arguments
+    #   NOTE: without any machine names, commands target every machine they can (see command_machines()),
+    #       names of machines they can't target are ignored
+    def split_machine_arguments(ctx, arguments):
+        targets   = command_machines(ctx)
+        names     = [ argument for argument in arguments if argument in targets ]
+        remaining = [ argument for argument in arguments if argument not in machines ]
+        return (names or targets, remaining)
+
+    # get the name of the watch list(s) for some machines, for use in messages
+    def watch_list_name(names):
+        if len(machines) == 1:
+            return 'the watch list'
+        return f"the `{', '.join(names)}` watch list"
+
+    # add or update a watcher of a machine, keeping its rendered watch list current
+    #   NOTE: a new watcher is added to the last page, any other change
+    #       re-renders the pages the next time they are needed
+    def set_watcher(machine, user_id, user):
+        line  = watcher_line(user_id, user)
+        pages = machine['pages']
+        if user_id not in machine['lines']:
+            if pages is not None:
+                if pages and len(pages[-1]) + len(line) <= watch_list_page_length:
+                    pages[-1] += line
+                else:
+                    pages.append(line)
+        elif machine['lines'][user_id] != line:
+            machine['pages'] = None
+        machine['users'][user_id] = user
+        machine['lines'][user_id] = line
         return
 
+    # remove a watcher of a machine, keeping its rendered watch list current
+    def unset_watcher(machine, user_id):
+        del machine['users'][user_id]
+        del machine['lines'][user_id]
+        machine['pages'] = None
+        return
+
+    # get the rendered watch list of a machine, split into pages
+    def watch_list_pages(machine):
+        if machine['pages'] is None:
+            pages  = []
+            lines  = []
+            length = 0
+            for line in machine['lines'].values():
+                if lines and length + len(line) > watch_list_page_length:
+                    pages.append(''.join(lines))
+                    lines  = []
+                    length = 0
+                lines.append(line)
+                length += len(line)
+            if lines:
+                pages.append(''.join(lines))
+            machine['pages'] = pages
+        return machine['pages']
+
+    # group the watch list pages of some machines into messages
+    #   NOTE: only lengths are added up here, so the cost grows with the number of pages, not watchers
+    #   format: [ [ (title, page) ] ]
+    def watch_list_messages(names):
+        messages = [ [] ]
+        length   = 0
+        for name in names:
+            title = 'Watch List' if len(machines) == 1 else f'{name} Watch List'
+            for page in watch_list_pages(machines[name]) or [ 'No current users watching\n' ]:
+                section_length = len(title) + len(page) + 20 # title, code block, and line breaks
+                if messages[-1] and length + section_length > message_max_length - 100:
+                    messages.append([])
+                    length = 0
+                messages[-1].append((title, page))
+                length += section_length
+        return messages
+
     # send list of current users
-    async def message_current_users(ctx, user_message = ''):
-        current_users = '\n'
-        nonlocal users
-        if users:
-            logger.info(f'Current Users:\n{users}')
-            current_users      =  'Watch List:\n```properties\n'
-            for index, user_id in enumerate(users):
-                current_users += f'{users[user_id].name} {users[user_id].id}\n'
-            current_users     +=  '```'
+    #   NOTE: long watch lists are split into pages, `page` picks which one is sent
+    async def message_current_users(ctx, user_message = '', names = None, page = 1):
+        names = list(machines) if names is None else names
+        if any(machines[name]['users'] for name in names):
+            messages      = watch_list_messages(names)
+            page          = min(max(page, 1), len(messages))
+            current_users = '\n'.join(f'{title}:\n```properties\n{lines}```' for title, lines in messages[page - 1])
+            if len(messages) > 1:
+                current_users += f'\nPage {page}/{len(messages)}'
+                if page < len(messages):
+                    current_users += f' (`{ctx.prefix}watchlist {page + 1}` for the next page)'
         else:
-            no_users_message   = 'No current users watching'
-            current_users      = no_users_message
-            logger.info(no_users_message)
+            current_users = 'No current users watching'
+        logger.info('Sending watch list of %s (page %s)', names, page)
+
+        # send what changed on its own if it doesn't fit along with the watch list
+        user_messages = split_message(user_message)
+        if len(user_messages[-1]) + len(current_users) > message_max_length:
+            user_messages.append('')
+        for message in user_messages[:-1]:
+            await queue_message(ctx, message)
+        await queue_message(ctx, user_messages[-1] + current_users)
+
+        # if command was received on a DM, also let the management channel (of each guild the machines are bound to) know what changed
+        #   NOTE: the watch list itself is only sent once, to the DM
+        if ctx.message.channel.type == discord.ChannelType.private and user_message:
+            for name in dict.fromkeys(guild_channel(machine_guilds.get(machine)) for machine in names):
+                for message in split_message(user_message):
+                    await send_channel_message(name, message = message)
+        return
 
-        if current_users:
-            complete_message   = user_message + current_users
-            logger.info(f'complete_message: {complete_message}')
-            await ctx.send(complete_message)
+    # (message id, recipient) pairs from the outbox currently being delivered
+    outbox_in_flight = set()
+
+    # get a user by ID, from the gateway cache or the API
+    async def get_user_by_id(user_id):
+        user = client.get_user(int(user_id))
+        if not user:
+            user = await client.fetch_user(user_id)
+        return user
+
+    # send every undelivered message in the outbox
+    #   NOTE: messages that fail with a permanent error (closed DMs, unknown users) are removed,
+    #       anything else is left for the next call (on the next completion, reconnect, or restart)
+    async def deliver_outbox():
+        pending = [ row for row in await run_database(load_outbox, outbox) if row[:2] not in outbox_in_flight ]
+        if not pending:
+            return
+        outbox_in_flight.update(row[:2] for row in pending)
+
+        all_users = get_all_users()
+        delivered = []
+        failed    = []
+
+        # send a single outbox message to its recipient
+        async def deliver_outbox_message(message_id, recipient, message, created):
+            kind, target = recipient.split(':', 1)
+            try:
+                if kind == 'channel':
+                    channel_obj = get_channel_by_name(target)
+                    if not channel_obj:
+                        # not connected yet, or the channel is gone
+                        raise LookupError(f'Unknown channel: {target}')
+                    await queue_message(channel_obj, message, priority_alert)
+                    observe(latency_histograms['post'], time.time() - created)
+                else:
+                    await send_dm(all_users.get(target) or await get_user_by_id(target), message, priority_alert)
+                delivered.append((message_id, recipient))
+            except (discord.Forbidden, discord.NotFound) as e:
+                # DMs are closed, or the user is gone, sending again won't help
+                logger.warning('Unable to deliver outbox message to %s, dropping it: %s', recipient, e)
+                delivered.append((message_id, recipient))
+            except Exception as e:
+                # not connected yet, the channel is gone, or anything else that may clear up by the next delivery
+                logger.warning('Unable to deliver outbox message to %s, will retry: %s', recipient, e)
+                failed.append((message_id, recipient))
+            return
 
-            # if command was received on a DM, also send output to a channel
-            if ctx.message.channel.type == discord.ChannelType.private:
-                logger.debug(f'Sending message of current_users:\n{current_users}')
-                await send_channel_message(message = complete_message)
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*[ deliver_outbox_message(*row) for row in pending ])
+        finally:
+            # mark everything delivered at once, rather than syncing the outbox once per recipient
+            #   NOTE: a crash before this point re-sends these messages on restart,
+            #       as does failing to remove them (they're left in the outbox, and sent again by the next delivery)
+            try:
+                await run_database(remove_outbox_messages, outbox, delivered)
+            except sqlite3.Error as e:
+                logger.error('Unable to remove %s delivered messages from the outbox: %s', len(delivered), e)
+            finally:
+                outbox_in_flight.difference_update(row[:2] for row in pending)
+        logger.info('Delivered %s/%s outbox messages in %.3fs', len(delivered), len(pending), time.perf_counter() - start)
         return
 
     # send message and dms when laundry is done
-    async def message_laundry_done(time_done = datetime.now()):
-        nonlocal users
+    #   NOTE: written to the outbox before anything is sent,
+    #       so a disconnect or crash right after the completion doesn't lose it.
+    #       If the outbox can't be written (a full SD card), it's sent directly instead,
+    #       and is only lost if the bot disconnects or restarts before it's sent
+    async def message_laundry_done(machine, time_done = None):
+        time_done        = time_done or datetime.now()
         format           = "%a, %b %-d @ %H:%M:%S (Arizona)" 
-        arizona_datetime = time_done - timedelta(hours = 7) # Arizona is UTC -0700
-        time_done_string = arizona_datetime.strftime(format)
-        message          = f'Washing cycle complete on `{time_done_string}`'
-        logger.debug(f'{message}')
-        await send_dms(users, message = message)
-        await send_channel_message(message = message)
+        time_done_string = to_arizona_time(time_done).strftime(format)
+        if len(machines) == 1:
+            message      = f'Washing cycle complete on `{time_done_string}`'
+        else:
+            message      = f'`{machine["name"]}` cycle complete on `{time_done_string}`'
+        logger.debug('%s', message)
+        recipients = [ f'channel:{guild_channel(machine["guild"], machine["channel"])}' ] + [ f'user:{user_id}' for user_id in machine['users'] ]
+        try:
+            await run_database(store_outbox_message, outbox, message, recipients)
+        except sqlite3.Error as e:
+            logger.error('Unable to write completion to the outbox, sending it directly: %s', e)
+            client.loop.create_task(send_channel_message(guild_channel(machine['guild'], machine['channel']), message, priority_alert))
+            client.loop.create_task(send_dms(machine['users'], message, priority_alert))
+            return
+        client.loop.create_task(deliver_outbox())
+        return
+
+    # get the estimate of how long a machine's cycle takes, when started at a datetime
+    #   NOTE: falls back to the estimate for any time of day, until the time of day has enough cycles
+    #   returns (mean seconds, standard deviation seconds), or None without enough cycles
+    def estimate_cycle(machine, started):
+        for bucket in (estimate_bucket(started), -1):
+            estimate = machine['estimates'].get(bucket)
+            if estimate and estimate[0] >= estimate_min_cycles:
+                return (estimate[1], estimate[2] ** 0.5)
+        return None
+
+    # send DMs to a machine's watchers that it's almost done
+    def message_laundry_soon(machine):
+        machine['eta_timer'] = None
+        minutes = round((machine['eta'] - datetime.now()).total_seconds() / 60)
+        if minutes < 1:
+            return
+        if len(machines) == 1:
+            message = f'Washing cycle should be done in ~{minutes} min'
+        else:
+            message = f'`{machine["name"]}` cycle should be done in ~{minutes} min'
+        logger.debug('%s', message)
+        client.loop.create_task(send_dms(machine['users'], message, priority_alert))
+        return
+
+    # work out when a machine's cycle should be done, and schedule the "done soon" DMs ahead of it
+    #   NOTE: the DMs are sent `notice` before the cycle should be done
+    #       (or right away, for cycles shorter than that), rather than polling for it
+    def schedule_eta(machine):
+        cancel_eta(machine)
+        estimate = estimate_cycle(machine, machine['started'])
+        if not estimate:
+            return
+        machine['eta'] = machine['started'] + timedelta(seconds = estimate[0])
+        logger.info('%s should be done at: %s', machine['name'], machine['eta'])
+        if notice:
+            delay = (machine['eta'] - notice - datetime.now()).total_seconds()
+            machine['eta_timer'] = client.loop.call_later(max(delay, 0), message_laundry_soon, machine)
+        return
+
+    # forget when a machine's cycle should be done, and cancel any "done soon" DMs
+    def cancel_eta(machine):
+        if machine['eta_timer']:
+            machine['eta_timer'].cancel()
+        machine['eta']       = None
+        machine['eta_timer'] = None
+        return
+
+    # sensor events waiting to be handled on the event loop
+    #   NOTE: filled from gpiozero's callback thread, and drained by handle_sensor_events()
+    #   format: (machine name, time.monotonic() of the edge, datetime of the edge, event kind)
+    sensor_events      = queue.Queue(maxsize = sensor_queue_size)
+    sensor_events_lock = threading.Lock()
+    sensor_events_task = None
+    sensor_wakeup      = None  # asyncio.Event, created on the event loop
+    sensor_wake_queued = False # whether a wakeup is already scheduled on the event loop
+    sensor_stats       = {
+        'received':   0, # events handled by the event loop
+        'dropped':    0, # events dropped because the queue was full
+        'dispatched': 0, # events that were sent as "complete" messages
+        'suppressed': 0, # "done" events within the machine's delay of the last one, so not sent
+    }
+
+    # wake handle_sensor_events() up
+    #   NOTE: always called on the event loop, via call_soon_threadsafe
+    def wake_sensor_events():
+        if sensor_wakeup:
+            sensor_wakeup.set()
         return
 
-    # wrapper function to call message_laundry_done
-    #   NOTE: needed by gpiozero, since it can't await async functions
-    def laundry_done_wrapper():
+    # wrapper function to queue sensor events for a machine
+    #   NOTE: needed by gpiozero, since it can't await async functions,
+    #       and runs on gpiozero's callback thread, so it must not touch the event loop
+    #       other than through call_soon_threadsafe
+    #   NOTE: the event kind is event_done when the light comes on, or event_off when it goes out,
+    #       and the value is given for raw edges (1 when lit), to record them
+    def laundry_done_wrapper(machine, kind = event_done, value = None):
+
+        def laundry_done():
+            nonlocal sensor_wake_queued
+
+            # record the raw edge first, so the trace has it even if the event is dropped
+            if trace and value is not None:
+                record_edge(trace, machine['name'], value)
+
+            # queue the event before checking for a scheduled wakeup,
+            #   so the event loop never sleeps on a queued event
+            try:
+                sensor_events.put_nowait((machine['name'], time.monotonic(), datetime.now(), kind))
+            except queue.Full:
+                with sensor_events_lock:
+                    sensor_stats['dropped'] += 1
+                return
+
+            # schedule a single wakeup for any number of queued events
+            if not sensor_wake_queued:
+                sensor_wake_queued = True
+                event_loop.call_soon_threadsafe(wake_sensor_events)
+            return
 
-        nonlocal laundry_done_last
-        nonlocal threshold_delta
-        
-        now = datetime.now()
-        delta_since_last_done = now - laundry_done_last
+        return laundry_done
+
+    # sensor events are handled one at a time, even from several agents,
+    #   so each sees the done_last and cycle left by the one before, while waiting on the database
+    sensor_event_lock = asyncio.Lock()
+
+    # handle a single sensor event, sending messages if it's beyond the machine's delay
+    #   NOTE: the light going out only starts the next cycle,
+    #       and is ignored while a cycle is already running (the light flickering), so the cycle keeps its start
+    #   NOTE: every "done" ends the cycle, even one suppressed by the delay, so no "done soon" DMs outlive it
+    async def handle_sensor_event(name, edge_time, now, kind = event_done):
+        async with sensor_event_lock:
+            machine = machines[name]
+            if kind == event_off:
+                sensor_stats['received'] += 1
+                if machine['started']:
+                    logger.debug('light went out at: %s (%s), cycle already started at: %s', now, name, machine['started'])
+                    return
+                logger.debug('light went out at: %s (%s)', now, name)
+                machine['started'] = now
+                schedule_eta(machine)
+                return
+            laundry_done_last     = machine['done_last']
+            threshold_delta       = machine['delay']
+            delta_since_last_done = now - laundry_done_last
+
+            logger.info( 'laundry done wrapper called at: %s (%s)', now, name)
+            logger.info( 'laundry was last done at:       %s', laundry_done_last)
+            logger.info( 'delta_since_last_done:          %s', delta_since_last_done)
+            logger.debug('threshold_delta:                %s', threshold_delta)
+            logger.debug('over threshold:                 %s', bool(delta_since_last_done > threshold_delta))
+
+            if delta_since_last_done > threshold_delta:
+                # only counted as done once the completion is accepted for delivery,
+                #   so if it isn't (an error is raised), the next edge (or the agent's replay of this one) tries again
+                logger.debug('last laundry load was done beyond the threshold duration')
+                await message_laundry_done(machine, now)
+                machine['done_last'] = now
+                logger.debug('set new laundry_done_last value: %s', now)
+                sensor_stats['dispatched'] += 1
+
+                # update the estimates of how long cycles take, for the time of day the cycle started in and for any time
+                started = machine['started']
+                updated = {}
+                if started and timedelta(0) < now - started <= estimate_max_duration:
+                    duration = (now - started).total_seconds()
+                    for bucket in (estimate_bucket(started), -1):
+                        updated[bucket] = update_estimate(machine['estimates'].get(bucket), duration)
+                    machine['estimates'].update(updated)
+
+                # add the cycle to the history
+                try:
+                    await run_database(store_cycle, history, name, started, now, updated)
+                except sqlite3.Error as e:
+                    logger.warning('Unable to add cycle to history: %s', e)
+            else:
+                sensor_stats['suppressed'] += 1
+            machine['started'] = None
+            cancel_eta(machine)
+
+            # record how long the event waited between the edge and being handled
+            latency = time.monotonic() - edge_time
+            sensor_stats['received'] += 1
+            observe(latency_histograms['detection'], latency)
+            logger.debug('sensor event latency:           %.3fms', latency * 1000)
+            return
 
-        logger.info( f'laundry done wrapper called at: {str(now)}')
-        logger.info( f'laundry was last done at:       {str(laundry_done_last)}')
-        logger.info( f'delta_since_last_done:          {str(delta_since_last_done)}')
-        logger.debug(f'threshold_delta:                {threshold_delta}')
-        logger.debug(f'over threshold:                 {bool(delta_since_last_done > threshold_delta)}')
+    # sample a machine's sensor at a fixed rate, passing the samples through a signal detector
+    #   NOTE: runs on a thread of its own, and calls laundry_done_wrapper
+    #       when the detector decides the machine is "done"
+    def sample_sensor(machine):
+        settings = machine['detector']
+        logger.info('sampling %s at %sHz: %s', machine['name'], settings['rate'], settings)
+        try:
+            sample_signal(machine['sensor'], settings, laundry_done_wrapper(machine), laundry_done_wrapper(machine, event_off),
+                          (lambda value: record_edge(trace, machine['name'], value)) if trace else None)
+        except gpiozero.GPIODeviceClosed:
+            pass # closed between samples, when the machine was moved to another pin
+        return
 
-        if delta_since_last_done > threshold_delta:
-            laundry_done_last = now
-            logger.debug(f'last laundry load was done beyond the threshold duration')
-            logger.debug(f'set new laundry_done_last value: {laundry_done_last}')
-            logger.debug(f'client.loop:                     {client.loop}')
-            client.loop.create_task(message_laundry_done(now))
+    # arm the sensor of a machine
+    #   either sampled through a signal detector, or treating every rising edge as "done"
+    #   (and every falling edge as the start of the next cycle)
+    def arm_sensor(machine):
+        if machine['detector']:
+            if not machine.get('sampler'):
+                machine['sampler'] = threading.Thread(target = sample_sensor,
+                                                      args   = (machine,),
+                                                      name   = f'sampler-{machine["name"]}',
+                                                      daemon = True)
+                machine['sampler'].start()
+        else:
+            machine['sensor'].when_activated   = laundry_done_wrapper(machine, event_done, 1)
+            machine['sensor'].when_deactivated = laundry_done_wrapper(machine, event_off, 0)
+        return
+
+    # last sequence number handled from each sensor agent
+    #   format: { (agent name, session): sequence number }
+    agent_sequences = {}
+    agent_server    = None
+
+    # handle a connection from a sensor agent
+    #   NOTE: events are handled (and so written to the outbox) before they're acknowledged,
+    #       so the agent replays anything that was in flight when a connection dropped.
+    #       Replayed events that were already handled are skipped by their sequence number.
+    #   NOTE: the agent is challenged with a new nonce, and must sign its HELLO for it (see PROTOCOL in sensor_agent.py)
+    #       within the handshake timeout. A malformed frame, or an event that can't be handled, disconnects it,
+    #       and it replays the unacknowledged events when it reconnects
+    async def handle_sensor_agent(reader, writer):
+        agent = writer.get_extra_info('peername') or 'sensor agent'
+        try:
+            nonce = os.urandom(challenge_body.size)
+            writer.write(encode_challenge(nonce))
+            frame_type, body = await asyncio.wait_for(read_frame(reader), handshake_timeout)
+            if frame_type != frame_hello:
+                logger.warning('Sensor agent %s sent frame type %s before HELLO, disconnecting', agent, frame_type)
+                return
+            try:
+                session, agent = decode_hello(body, nonce, secret)
+            except ValueError as e:
+                logger.warning('Sensor agent %s sent a HELLO that was rejected, disconnecting: %s', agent, e)
+                return
+            key = (agent, session)
+            writer.write(encode_ack(agent_sequences.get(key, 0)))
+            logger.info('Sensor agent %s connected', agent)
+
+            while True:
+                frame_type, body = await read_frame(reader)
+                if frame_type != frame_event:
+                    continue
+                sequence, timestamp, kind, name = decode_event(body)
+                last = agent_sequences.get(key, 0)
+                if sequence <= last:
+                    continue
+                if sequence > last + 1 and last:
+                    logger.warning('Missed %s events from sensor agent %s', sequence - last - 1, agent)
+
+                if name in machines:
+                    # the agent timestamped the event, the latency is measured from there
+                    edge_time = time.monotonic() - max(0.0, time.time() - timestamp)
+                    logger.debug('%s from sensor agent %s (sequence %s)', event_names.get(kind, kind), agent, sequence)
+                    await handle_sensor_event(name, edge_time, datetime.fromtimestamp(timestamp), event_off if kind == event_off else event_done)
+                else:
+                    logger.warning('Sensor agent %s sent an event for an unknown machine: %s', agent, name)
+                agent_sequences[key] = sequence
+                writer.write(encode_ack(sequence))
+        except asyncio.TimeoutError:
+            logger.warning('Sensor agent %s sent no HELLO within %ss, disconnecting', agent, handshake_timeout)
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logger.exception('Unable to handle sensor agent %s, disconnecting', agent)
+        finally:
+            writer.close()
+        logger.info('Sensor agent %s disconnected', agent)
+        return
+
+    # listen for sensor agents, until cancelled
+    #   NOTE: over TCP, agents must sign their HELLO with the shared secret, so it's required
+    async def serve_sensor_agents():
+        try:
+            if parse_address(listen)[0] == 'tcp' and not secret:
+                raise ValueError('a shared secret (secret) is required to listen on TCP')
+            server = await start_server(handle_sensor_agent, listen)
+        except (OSError, ValueError) as e:
+            logger.error('Unable to listen for sensor agents on %s: %s', listen, e)
+            return
+        logger.info('Listening for sensor agents on %s', listen)
+        await server.serve_forever()
+
+    # consume sensor events queued by laundry_done_wrapper, on the event loop
+    async def handle_sensor_events():
+        nonlocal sensor_wake_queued
+        dropped = 0
+        while True:
+            await sensor_wakeup.wait()
+            sensor_wakeup.clear()
+
+            # clear the flag before draining, so any event queued from here on schedules a new wakeup
+            sensor_wake_queued = False
+            while True:
+                try:
+                    event = sensor_events.get_nowait()
+                except queue.Empty:
+                    break
+                # an event that fails to be handled is logged and dropped,
+                #   so this (the only consumer of the queue) keeps running for the events after it
+                try:
+                    await handle_sensor_event(*event)
+                except Exception:
+                    logger.exception('Unable to handle sensor event: %s', event)
+
+            # report events dropped during an edge storm
+            if sensor_stats['dropped'] != dropped:
+                logger.warning('Dropped %s sensor events (queue full), %s total',
+                               sensor_stats['dropped'] - dropped, sensor_stats['dropped'])
+                dropped = sensor_stats['dropped']
+
+
+    #--[ STARTUP ]-----------------------------------------------------------------------------------------------------
+
+    # initalize GPIO watching, and arm the sensor of each machine before anything else is imported or connected to
+    #   NOTE: when listening for sensor agents, they own the sensors instead.
+    #       Edges from here on are queued, and handled once the client is ready
+    #       (with the time of the edge, so the delay between completions still holds).
+    #       The sensors are only armed once, on_ready is called again on reconnects
+    if not listen:
+        import gpiozero # type: ignore
+        for machine in machines.values():
+            machine['sensor'] = gpiozero.DigitalInputDevice(machine['gpiopin'], pull_up = True)
+            arm_sensor(machine)
+    end_startup_phase('gpio')
+
+    # the command prefix of a message, from the settings of the guild it was sent in, falling back to the global prefix
+    #   NOTE: looked up for every message, since reloading the config can change it
+    def get_prefix(bot, message):
+        guild_config = guilds.get(message.guild.id, {}) if message.guild else {}
+        return guild_config.get('prefix') or prefix
+
+    # discord client
+    # NOTE: intents are needed to get users by id, 
+    #   this must be set in the Discord Dev Center:
+    #       https://discord.com/developers/applications/ ->
+    #       Application -> Bot -> SERVER MEMBERS INTENT (ON)
+    # NOTE: in low-memory mode, members are neither requested nor cached,
+    #   usernames are searched for when needed instead
+    import aiohttp
+    import discord
+    from discord.ext import commands
+    intents         = discord.Intents.default()
+    intents.members = not lowmemory
+    member_options  = {}
+    if lowmemory:
+        member_options = {
+            'member_cache_flags':      discord.MemberCacheFlags.none(),
+            'chunk_guilds_at_startup': False,
+        }
+    # NOTE: with shards, the gateway connections (and the events of each guild) are split across shards,
+    #   all run on the one event loop, as many as Discord recommends with "auto"
+    shard_options = {}
+    if shards:
+        shard_options = {
+            'shard_count': None if shards == 'auto' else shards,
+        }
+    #client          = discord.Client(intents = intents)
+    client          = (commands.AutoShardedBot if shards else commands.Bot)(command_prefix = get_prefix,
+                                                                            intents        = intents,
+                                                                            loop           = event_loop,
+                                                                            **member_options,
+                                                                            **shard_options)
+    end_startup_phase('client')
+
+    # log how long each phase of startup took, once the last one has ended
+    def report_startup():
+        if startupprofile:
+            logger.info('Startup profile, %s', format_startup_profile(startup_phases))
         return
 
 
@@ -216,21 +1907,24 @@ def main(args):
         #   assume the user passed their own username
         if not username:
             logger.debug( 'no argument passed to command')
-            logger.debug(f'netting argument to author: {ctx.author.name}')
+            logger.debug('netting argument to author: %s', ctx.author.name)
             user_id = str(ctx.author.id)
             message = f'`{ctx.author.name}`\'s user ID is:\n`{user_id}`'
             if send_message:
-                await ctx.send(message)
+                await queue_message(ctx, message)
             return user_id
 
-        logger.info(f'attempting to find user ID for: {username}')
+        logger.info('attempting to find user ID for: %s', username)
 
-        # get a member that matches the username, from all members of the guild
-        member = discord.utils.get(client.get_all_members(), name = username)
+        # get a member that matches the username, from the member indexes (or a search, in low-memory mode)
+        if lowmemory:
+            member = await search_member_by_name(username)
+        else:
+            member = get_member_by_name(username)
 
         if member:
-            logger.debug(f'member:    {member}')
-            logger.info( f'member.id: {member.id}')
+            logger.debug('member:    %s', member)
+            logger.info( 'member.id: %s', member.id)
             user_id = member.id
             message = f'`{username}`\'s user ID is:\n`{user_id}`'
             logger.info(message)
@@ -239,79 +1933,212 @@ def main(args):
             logger.warning(message)
 
         if send_message:
-            await ctx.send(message)
+            await queue_message(ctx, message)
 
         return user_id
 
     # list all current watchers
     @client.command(name = 'watchlist', aliases = ['watchers', 'list', 'users'])
-    async def list_watchers(ctx):
-        await message_current_users(ctx)
+    async def list_watchers(ctx, *names):
+        names, remaining = split_machine_arguments(ctx, names)
+        page = next((int(argument) for argument in remaining if argument.isdecimal()), 1)
+        await message_current_users(ctx, names = names, page = page)
+        return
+
+    # list the most recent cycles
+    #   NOTE: machine names may be passed, along with how many cycles to list
+    @client.command(name = 'history', aliases = ['cycles'])
+    async def list_history(ctx, *arguments):
+        names, remaining = split_machine_arguments(ctx, arguments)
+        limit  = next((int(argument) for argument in remaining if argument.isdecimal()), history_list_default)
+        cycles = await run_database(load_cycles, history, names, min(max(limit, 1), history_list_max))
+
+        if not cycles:
+            message = 'No cycles recorded yet'
+        else:
+            lines = []
+            for name, started, ended, duration in cycles:
+                started_string = to_arizona_time(started).strftime('%a, %b %-d @ %H:%M') if started else '?'
+                ended_string   = to_arizona_time(ended).strftime('%H:%M' if started and started.date() == ended.date() else '%a, %b %-d @ %H:%M')
+                line           = f'{started_string} - {ended_string}'
+                if duration is not None:
+                    line += f' ({format_duration(duration)})'
+                if len(machines) > 1:
+                    line = f'{name} {line}'
+                lines.append(line)
+            message = f'Last {len(cycles)} cycles:\n```properties\n' + '\n'.join(lines) + '\n```'
+
+        await queue_message(ctx, message)
+        return
+
+    # show cycle stats: cycles today and this week, cycle durations, and the busiest hours
+    #   NOTE: machine names may be passed, along with how many days to cover,
+    #       and every stat comes from the daily rollups, so this stays fast over years of history
+    @client.command(name = 'stats')
+    async def show_stats(ctx, *arguments):
+        names, remaining = split_machine_arguments(ctx, arguments)
+        days  = min(max(next((int(argument) for argument in remaining if argument.isdecimal()), stats_days), 1), stats_days_max)
+        today = to_arizona_time(datetime.now()).date()
+        stats = await run_database(load_stats, history, names, today - timedelta(days = days - 1))
+
+        lines = [
+            f'Cycles today:      {await run_database(count_cycles, history, names, today)}',
+            f'Cycles this week:  {await run_database(count_cycles, history, names, today - timedelta(days = today.weekday()))}',
+            f'Cycles ({days} days): {stats["cycles"]}',
+        ]
+        if stats['average'] is not None:
+            lines.append(f'Average duration:  {format_duration(stats["average"])}')
+            lines.append(f'Median duration:   {stats["percentiles"][0.5]} min')
+            lines.append(f'90% finish within: {stats["percentiles"][0.9] + 1} min')
+        if stats['hours']:
+            lines.append('Busiest hours:     ' + ', '.join(f'{hour:02}:00 ({cycles})' for hour, cycles in stats['hours'][:3]))
+
+        title   = 'Stats' if len(machines) == 1 else f"`{', '.join(names)}` stats"
+        message = f'{title} (last {days} days):\n```properties\n' + '\n'.join(lines) + '\n```'
+        await queue_message(ctx, message)
+        return
+
+    # show whether machines are running, and when they should be done
+    #   NOTE: machine names may be passed, and the estimate was already worked out when the cycle started
+    @client.command(name = 'status', aliases = ['eta'])
+    async def show_status(ctx, *arguments):
+        names, remaining = split_machine_arguments(ctx, arguments)
+        now   = datetime.now()
+        lines = []
+        for name in names:
+            machine = machines[name]
+            if machine['started']:
+                line = f'running for {format_duration((now - machine["started"]).total_seconds())}'
+                if machine['eta']:
+                    left    = (machine['eta'] - now).total_seconds()
+                    spread  = estimate_cycle(machine, machine['started'])[1]
+                    line   += f', done in ~{format_duration(left)}' if left >= 60 else ', should be done any minute'
+                    line   += f' ({to_arizona_time(machine["eta"]).strftime("%H:%M")} ± {format_duration(spread)})'
+            else:
+                cycles = await run_database(load_cycles, history, [ name ], 1)
+                line   = 'idle'
+                if cycles:
+                    line += f', last done {to_arizona_time(cycles[0][2]).strftime("%a, %b %-d @ %H:%M")}'
+            lines.append(f'{name}: {line}' if len(machines) > 1 else line)
+
+        message = 'Status:\n```properties\n' + '\n'.join(lines) + '\n```'
+        await queue_message(ctx, message)
         return
 
-    # send a DM to all watchers
+    # profile the event loop for a number of seconds, then post its hot spots and save the full profile to a file
+    #   NOTE: only the bot's owner (the owner of its Discord application) can run it,
+    #       the event loop keeps running while it's sampled from another thread
+    profiling = False
+    @client.command(name = 'profile')
+    async def profile_event_loop(ctx, seconds = ''):
+        nonlocal profiling
+        if not await client.is_owner(ctx.author):
+            await queue_message(ctx, 'Only the owner of the bot can profile it')
+            return
+        if profiling:
+            await queue_message(ctx, 'Already profiling, try again once it\'s done')
+            return
+
+        seconds = min(max(int(seconds) if seconds.isdecimal() else profile_seconds, 1), profile_seconds_max)
+        logger.info('Profiling the event loop for %ss (requested by %s)', seconds, ctx.author)
+        await queue_message(ctx, f'Profiling for {seconds}s...')
+        profiling = True
+        try:
+            profile = await client.loop.run_in_executor(None, sample_stack, threading.get_ident(), seconds) # this is the event loop's thread
+        finally:
+            profiling = False
+
+        path = datetime.now().strftime(profile_file)
+        try:
+            with open(path, 'w') as profile_output:
+                profile_output.write(format_profile(profile, seconds, full = True))
+            saved = f'Saved the full profile to `{path}`'
+        except OSError as e:
+            logger.warning('Unable to save profile to %s: %s', path, e)
+            saved = 'Unable to save the full profile, check the server log for details'
+
+        for message in split_message('```\n' + format_profile(profile, seconds, top = profile_top) + '```\n' + saved):
+            await queue_message(ctx, message)
+        return
+
+    # send a DM to all watchers (of the machines the command can target)
     @client.command(name = 'broadcast', aliases = ['dm'])
     async def send_dm_to_all_watchers(ctx, message = 'test DM to all watchers'):
-        nonlocal users
-        await send_dms(users, message)
+        await send_dms(get_all_users(command_machines(ctx)), message)
         return
 
     # add user to watch list
+    #   NOTE: machine names may be passed along with user IDs or usernames,
+    #       otherwise users are added to the watch list of every machine
     @client.command(name = 'add', aliases = ['watch', 'subscribe'])
     async def add_user_to_watchers(ctx, *user_ids_or_names):
 
+        names, user_ids_or_names = split_machine_arguments(ctx, user_ids_or_names)
+        logger.debug('machines: %s', names)
+
         # if no user IDs or usernames were passed as arguments, 
         #   assume the user passed their own user ID
         if not user_ids_or_names:
             logger.debug( 'No arguments passed to command')
-            logger.debug(f'Using author ID {ctx.author.id} as argument')
+            logger.debug('Using author ID %s as argument', ctx.author.id)
             user_ids_or_names = [ str(ctx.author.id) ]
 
-        logger.debug(f'user_ids_or_names: {user_ids_or_names}')
+        logger.debug('user_ids_or_names: %s', user_ids_or_names)
 
-        # include nonlocal users 
-        nonlocal users
-        logger.debug(f'nonlocal users: {users}')
+        all_users = get_all_users()
+        logger.debug('all users: %s', all_users)
 
         user_message = ''
+        added        = {} # format: { user id: [ machine names ] }
         # iterate over all user IDs or usernames
         for index, user_id in enumerate(user_ids_or_names):
 
             username = ''
             # if an argument wasn't numeric, try to get the user ID from the username
-            if not user_id.isnumeric():
+            if not user_id.isdecimal():
                 username = user_id
-                logger.warning(f'The argument is not numeric ({username})')
-                logger.info(   f'Trying to get user ID from username...')
-                user_id = str(await get_id_by_username(ctx, username, send_message = False))
-                logger.debug(  f'user_id after get_id_by_username: {user_id}')
-                logger.debug(  f'if not user_id ({bool(not user_id)}) or user_id == None ({bool(user_id == None)}): ')
-                if not user_id or user_id == None:
-                    logger.warning(f'Unable to get user ID for username: {username}')
+                logger.warning('The argument is not numeric (%s)', username)
+                logger.info(   'Trying to get user ID from username...')
+                user_id = await get_id_by_username(ctx, username, send_message = False)
+                logger.debug(  'user_id after get_id_by_username: %s', user_id)
+                if not user_id:
+                    logger.warning('Unable to get user ID for username: %s', username)
                     continue
-
-            # if the user ID is not in the users dict, 
-            #   1. add the user ID as a new key
-            #   2. fetch user details
-            #   3. DM the user to let them know they've been added
-            logger.debug(f'if user_id ({user_id}) not in users: {bool(user_id not in users)}')
-            if user_id not in users:
-                logger.info(f'User ID {user_id} not in users list')
-                users[user_id] = None
-                logger.debug(f'Users: {users}')
-                users = await set_user_details(users)
-                user_message += f'Added `{users[user_id].name}` to the watch list\n'
-                add_message   = f'You have been added to the watch list'
-                if users[user_id].id != ctx.author.id:
-                    user_message += f'(requested by `{ctx.author.name}`)\n'
-                    add_message  += f' by `{ctx.author.name}`'
-                await send_dm(users[user_id], message = add_message)
+                user_id = str(user_id)
+
+            # note which machines the user ID is not already watching
+            added_to = [ name for name in names if user_id not in machines[name]['users'] ]
+            logger.debug('user_id (%s) not watching: %s', user_id, added_to)
+            if added_to:
+                logger.info('User ID %s not in users list of: %s', user_id, added_to)
+                added[user_id] = added_to
             else:
-                user_message +=  f'User `{username or user_id}` is already on the watch list\n'
-
-            logger.info(user_message)
-
-        await message_current_users(ctx, user_message)
+                user_message +=  f'User `{username or user_id}` is already on {watch_list_name(names)}\n'
+
+        # fetch user details for all new users at once
+        new_users = await set_user_details({ user_id: all_users.get(user_id) for user_id in added })
+
+        # add each new user to the machines' watch lists, and DM them to let them know they've been added
+        for user_id, added_to in added.items():
+            user = new_users[user_id]
+            if not user:
+                logger.warning('Unable to get user details for user ID: %s', user_id)
+                user_message += f'Unable to find user `{user_id}`\n'
+                continue
+            for name in added_to:
+                set_watcher(machines[name], user_id, user)
+                # write the new watcher through to the store
+                store_watchers(watcher_store, name, [ user_id ])
+            user_message += f'Added `{user.name}` to {watch_list_name(added_to)}\n'
+            add_message   = f'You have been added to {watch_list_name(added_to)}'
+            if user.id != ctx.author.id:
+                user_message += f'(requested by `{ctx.author.name}`)\n'
+                add_message  += f' by `{ctx.author.name}`'
+            await send_dm(user, message = add_message)
+
+        logger.info(user_message)
+
+        await message_current_users(ctx, user_message, names)
         return
 
     # # handle errors on adding users
@@ -323,21 +2150,22 @@ def main(args):
     #     return
 
     # remove user from watch list
+    #   NOTE: machine names may be passed along with user IDs or usernames,
+    #       otherwise users are removed from the watch list of every machine
     @client.command(name = 'remove', aliases = ['unwatch', 'unsubscribe', 'stop'])
     async def remove_user_from_watchers(ctx, *user_ids_or_names):
 
+        names, user_ids_or_names = split_machine_arguments(ctx, user_ids_or_names)
+        logger.debug('machines: %s', names)
+
         # if no user IDs or usernames were passed as arguments, 
         #   assume the user passed their own user ID
         if not user_ids_or_names:
             logger.debug( 'No arguments passed to command')
-            logger.debug(f'Using author ID {ctx.author.id} as argument')
+            logger.debug('Using author ID %s as argument', ctx.author.id)
             user_ids_or_names = [ str(ctx.author.id) ]
 
-        logger.debug(f'user_ids_or_names: {user_ids_or_names}')
-
-        # include nonlocal users
-        nonlocal users
-        logger.debug(f'nonlocal users: {users}')
+        logger.debug('user_ids_or_names: %s', user_ids_or_names)
 
         user_message = ''
         # iterate over all user IDs or usernames
@@ -345,60 +2173,527 @@ def main(args):
 
             username = ''
             # if an argument wasn't numeric, try to get the user ID from the username
-            if not user_id.isnumeric():
+            if not user_id.isdecimal():
                 username = user_id
-                logger.warning(f'The argument is not numeric ({username})')
-                logger.info(   f'Trying to get user ID from username...')
-                user_id = str(await get_id_by_username(ctx, username, send_message = False))
-                logger.debug(  f'user_id after get_id_by_username: {user_id}')
-                logger.debug(  f'if not user_id ({bool(not user_id)}) or user_id == None ({bool(user_id == None)}): ')
-                if not user_id or user_id == None:
-                    logger.warning(f'Unable to get user ID for username: {username}')
+                logger.warning('The argument is not numeric (%s)', username)
+                logger.info(   'Trying to get user ID from username...')
+                user_id = await get_id_by_username(ctx, username, send_message = False)
+                logger.debug(  'user_id after get_id_by_username: %s', user_id)
+                if not user_id:
+                    logger.warning('Unable to get user ID for username: %s', username)
                     continue
+                user_id = str(user_id)
 
-            # if the user ID is in the users dict: 
+            # if the user ID is in the users dict of any of the machines: 
             #   1. message the user they are being removed from watch list
-            #   2. delete the key from the users dict
+            #   2. delete the key from the users dicts
             #   3. send a confirmation message the user was removed
-            logger.debug(f'if user_id ({user_id}) in users: {bool(user_id in users)}')
-            if user_id in users:
-                user_message   += f'Removed `{users[user_id].name}` from the watch list\n'
-                remove_message  = f'You have been removed from the watch list'
-                if users[user_id].id != ctx.author.id:
+            removed_from = [ name for name in names if user_id in machines[name]['users'] ]
+            logger.debug('user_id (%s) watching: %s', user_id, removed_from)
+            if removed_from:
+                user = next(machines[name]['users'][user_id] for name in removed_from)
+                user_message   += f'Removed `{user.name if user else user_id}` from {watch_list_name(removed_from)}\n'
+                remove_message  = f'You have been removed from {watch_list_name(removed_from)}'
+                if str(ctx.author.id) != user_id:
                     user_message   += f'(requested by `{ctx.author.name}`)\n'
                     remove_message += f' by `{ctx.author.name}`'
-                await send_dm(users[user_id], message = remove_message)
-                del users[user_id]
+                if user:
+                    await send_dm(user, message = remove_message)
+                for name in removed_from:
+                    unset_watcher(machines[name], user_id)
+                    store_watchers(watcher_store, name, [ user_id ], watching = False)
             else:
-                user_message +=  f'User `{username or user_id}` is not on the watch list\n'
+                user_message +=  f'User `{username or user_id}` is not on {watch_list_name(names)}\n'
                 
             logger.info(user_message)
 
-        await message_current_users(ctx, user_message)
+        await message_current_users(ctx, user_message, names)
         return
 
-
     #--[ READY ]-------------------------------------------------------------------------------------------------------
 
     @client.event
     async def on_ready():
+        connection_stats['connects'] += 1
+        if end_startup_phase('ready'):
+            report_startup()
+
+        # (re)build the channel index from every guild the bot is in
+        channels_by_name.clear()
+        for guild in client.guilds:
+            index_guild(guild)
+        logger.debug('indexed channels: %s', list(channels_by_name))
+
+        # (re)build the member indexes from every guild the bot is in
+        members_by_name.clear()
+        members_by_folded_name.clear()
+        for member in client.get_all_members():
+            index_member(member)
+        logger.debug('indexed members: %s', len(members_by_name))
+
+        # handle the sensor events queued since startup before anything else,
+        #   the announcement (a post, and a DM to every watcher) runs on its own, so it can't hold them up
+        start_sensors()
+        start_config_watch()
+        start_watchdog()
+        start_metrics()
+        client.loop.create_task(announce_online())
+        return
+
+    # send the online message to the management channel and all watchers,
+    #   then send anything left in the outbox from before a disconnect or restart
+    #   NOTE: a failure to announce (a post or DM that errors) is only logged, so it never stops startup,
+    #       and the outbox is still delivered
+    async def announce_online():
+        try:
+            # set an online message, log it, and send it to the management channel (of every guild)
+            #   NOTE: the global management channel may be the same channel as a guild's, it's only sent once
+            online_message = f'{client.user.name} is online and watching laundry'
+            logger.info(online_message)
+            sent = set()
+            for name in management_channels():
+                channel_obj = get_channel_by_name(name)
+                if channel_obj and channel_obj.id not in sent:
+                    sent.add(channel_obj.id)
+                    await send_channel_message(name, message = online_message, priority = priority_broadcast)
+
+            # if users are present, 
+            #   set their user details and send them all a message too
+            all_users = get_all_users()
+            logger.debug('all users: %s', all_users)
+            if all_users:
+                all_users = await set_all_user_details()
+                await send_dms(all_users, message = online_message)
+        except Exception:
+            logger.exception('Unable to announce that %s is online', client.user)
+
+        client.loop.create_task(deliver_outbox())
+        return
+
+    # start handling sensor events, and listen for sensor agents
+    def start_sensors():
+
+        # start handling sensor events (only once, on_ready is called again on reconnects)
+        nonlocal sensor_events_task
+        nonlocal sensor_wakeup
+        if not sensor_events_task:
+            sensor_wakeup      = asyncio.Event()
+            sensor_events_task = client.loop.create_task(handle_sensor_events())
+            sensor_wakeup.set() # handle any events queued since the sensors were armed
+            logger.info('Resident memory at startup: %.1f MiB (low-memory mode %s, notifier mode %s)',
+                        resident_memory(), 'on' if lowmemory else 'off', 'on' if webhook else 'off')
+
+        # listen for sensor agents (the GPIO sensors were armed at startup)
+        nonlocal agent_server
+        if listen and not agent_server:
+            agent_server = client.loop.create_task(serve_sensor_agents())
+        return
+
+
+    #--[ NOTIFIER ]----------------------------------------------------------------------------------------------------
+
+    # in notifier mode there is no gateway session (and so no commands or on_ready):
+    #   1. sensor events are handled right away, so completions are sent as soon as the bot logs in
+    #   2. the bot logs in over REST only, which DMs are sent with
+    #   3. webhooks and the REST client share one keep-alive connection pool
+    async def start_notifier():
+        nonlocal webhook_session
+        start_sensors()
+        start_config_watch()
+        start_watchdog()
+        start_metrics()
+
+        client.http.connector = aiohttp.TCPConnector()
+        webhook_session       = aiohttp.ClientSession(connector = client.http.connector, connector_owner = False)
+        for url in { channel, *[ machine['channel'] for machine in machines.values() ] }:
+            get_webhook(url) # fail on a bad webhook URL right away
+
+        data = await client.http.static_login(token.strip(), bot = True)
+        client._connection.user = discord.ClientUser(state = client._connection, data = data)
+        logger.info('%s logged in (notifier mode)', client.user)
+        if end_startup_phase('login'):
+            report_startup()
+
+        await announce_online()
+        return
+
+    # run the notifier until interrupted, then close its sessions
+    def run_notifier():
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                client.loop.add_signal_handler(signal_number, client.loop.stop)
+            except NotImplementedError:
+                pass
+        try:
+            client.loop.run_until_complete(start_notifier())
+            client.loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            tasks = asyncio.all_tasks(client.loop)
+            for task in tasks:
+                task.cancel()
+            client.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions = True))
+            if webhook_session:
+                client.loop.run_until_complete(webhook_session.close())
+            client.loop.run_until_complete(client.close())
+            client.loop.close()
+        return
+
+
+    #--[ RELOAD ]------------------------------------------------------------------------------------------------------
+
+    # settings that only take effect on a restart
+    #   NOTE: all other settings are applied to the running bot when the config file is reloaded
+    restart_settings = ('token', 'loglevel', 'concurrency', 'detector', 'listen', 'secret', 'webhook', 'lowmemory', 'metrics', 'record', 'startupprofile', 'shards')
+
+    # move a machine's sensor to another GPIO pin, and arm it again
+    #   NOTE: closing the old sensor also stops its sampler thread, if it has one
+    def move_sensor(machine, pin):
+        try:
+            sensor = gpiozero.DigitalInputDevice(pin, pull_up = True)
+        except gpiozero.GPIOZeroError as e:
+            logger.error('Unable to watch GPIO pin %s for %s, staying on pin %s: %s', pin, machine['name'], machine['gpiopin'], e)
+            return
+        machine['sensor'].close()
+        machine['sensor']  = sensor
+        machine['sampler'] = None
+        machine['gpiopin'] = pin
+        arm_sensor(machine)
+        logger.info('Moved %s to GPIO pin %s', machine['name'], pin)
+        return
+
+    # re-read the config file, and apply the settings that changed to the running bot
+    #   NOTE: only settings that changed in the file are applied, so settings given on the command line
+    #       (or as environment variables) stay as they are until they're changed in the file.
+    #       Settings removed from the file keep their current values until a restart.
+    async def reload_config():
+        nonlocal config, channel, delay, gpiopin, prefix, watchers, coalesce, notice, guild_configs
+        try:
+            new_config = read_config()
+        except (OSError, ValueError) as e:
+            logger.warning('Unable to reload %s, keeping the current settings: %s', config_file, e)
+            return
+        changed = [ key for key in new_config if new_config[key] != config.get(key) ]
+        config  = new_config
+        if not changed:
+            logger.info('Reloaded %s, nothing changed', config_file)
+            return
+        logger.info('Reloaded %s, changed: %s', config_file, ', '.join(changed))
+
+        restart = [ key for key in changed if key in restart_settings ]
+        if restart:
+            logger.warning('Changes to %s take effect on the next restart', ', '.join(restart))
+
+        # global settings
+        #   NOTE: without a gateway session, the management channel stays the webhook
+        if 'channel' in changed and not webhook:
+            channel  = config['channel']
+        if 'delay' in changed:
+            delay    = to_timedelta(config['delay'])
+        if 'gpiopin' in changed:
+            gpiopin  = int(config['gpiopin'])
+        if 'prefix' in changed:
+            prefix   = config['prefix']
+        if 'watchers' in changed:
+            watchers = config['watchers']
+        if 'coalesce' in changed:
+            coalesce = config['coalesce']
+        if 'notice' in changed:
+            notice   = timedelta(minutes = config['notice'])
+
+        # per-machine settings, for the machines already being watched
+        if 'machines' in changed:
+            added_or_removed = config['machines'].keys() ^ machines.keys()
+            if added_or_removed:
+                logger.warning('Adding or removing machines (%s) takes effect on the next restart', ', '.join(added_or_removed))
+            redetected = [ name for name, machine_config in config['machines'].items()
+                           if name in machines and machine_config.get('detector') != machine_configs[name].get('detector') ]
+            if redetected:
+                logger.warning('Changes to the detector of %s take effect on the next restart', ', '.join(redetected))
+            machine_configs.update((name, machine_config) for name, machine_config in config['machines'].items() if name in machines)
+
+        # per-guild settings, and which machines are bound to each guild
+        if 'guilds' in changed:
+            guild_configs = config['guilds']
+            index_guild_configs()
+
+        # apply the settings to every machine, and merge in any new watchers
+        #   NOTE: as on startup, watchers who unsubscribed aren't added back
+        known_watchers = load_watchers(watcher_store)
+        added          = 0
+        for name, machine in machines.items():
+            settings = machine_settings(name, machine_configs[name])
+            machine['guild']   = settings['guild']
+            machine['delay']   = settings['delay']
+            machine['channel'] = settings['channel']
+            if settings['gpiopin'] != machine['gpiopin']:
+                if machine['sensor']:
+                    move_sensor(machine, settings['gpiopin'])
+                else:
+                    machine['gpiopin'] = settings['gpiopin'] # sensor agents own the sensors
+
+            known = known_watchers.get(name, {})
+            new   = list(dict.fromkeys(user_id for user_id in machine_watchers(name, machine_configs[name]) if user_id and user_id not in known))
+            store_watchers(watcher_store, name, new)
+            for user_id in new:
+                set_watcher(machine, user_id, None)
+            added += len(new)
+
+        if added:
+            logger.info('Added %s watchers from %s', added, config_file)
+            await set_all_user_details()
+        return
+
+    # reload the config file on SIGHUP, or when the file changes, until cancelled
+    #   NOTE: the file's modification time is polled, rather than depending on a file-change notification API
+    async def watch_config():
+        nonlocal config_modified
+        reload_requested = asyncio.Event()
+        try:
+            client.loop.add_signal_handler(signal.SIGHUP, reload_requested.set)
+        except (AttributeError, NotImplementedError):
+            pass # no SIGHUP on this platform, only changes to the file are noticed
+        while True:
+            try:
+                await asyncio.wait_for(reload_requested.wait(), config_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            if reload_requested.is_set() or file_modified(config_file) != config_modified:
+                reload_requested.clear()
+                config_modified = file_modified(config_file)
+                await reload_config()
+
+    # start watching the config file (only once, on_ready is called again on reconnects)
+    config_watch_task = None
+    def start_config_watch():
+        nonlocal config_watch_task
+        if not config_watch_task:
+            config_watch_task = client.loop.create_task(watch_config())
+        return
+
+
+    #--[ WATCHDOG ]----------------------------------------------------------------------------------------------------
+
+    # everything runs on the one event loop, so anything that blocks it holds up every command and alert:
+    #   1. a task beats every watchdog_interval seconds, measuring how late the loop ran
+    #   2. a thread checks for missed beats, and once the loop has been blocked for stall_threshold seconds,
+    #       logs the stack it's blocked in (once per stall)
+    loop_stats = {
+        'thread':    None, # thread ID the event loop runs on
+        'heartbeat': None, # time.monotonic() of the last beat
+        'lag':       0.0,  # seconds the event loop ran late, at the last beat
+        'stalls':    0,    # stalls logged
+    }
+    watchdog_thread = None
+
+    # beat, measuring how late the event loop runs, until cancelled
+    async def beat_event_loop():
+        loop_stats['thread'] = threading.get_ident()
+        while True:
+            start = time.monotonic()
+            loop_stats['heartbeat'] = start
+            await asyncio.sleep(watchdog_interval)
+            loop_stats['lag'] = max(0.0, time.monotonic() - start - watchdog_interval)
+
+    # check for stalls of the event loop, on a thread of its own, until the loop is closed
+    def watch_event_loop():
+        reported = None
+        while not client.loop.is_closed():
+            time.sleep(watchdog_interval)
+            heartbeat = loop_stats['heartbeat']
+            stalled   = time.monotonic() - heartbeat - watchdog_interval
+            if stalled > stall_threshold and heartbeat != reported:
+                reported = heartbeat
+                frame    = sys._current_frames().get(loop_stats['thread'])
+                stack    = ''.join(traceback.format_stack(frame)) if frame else '(unknown)\n'
+                frame    = None
+                loop_stats['stalls'] += 1
+                logger.warning('Event loop blocked for %.3fs so far, in:\n%s', stalled, stack.rstrip())
+        return
+
+    # start the heartbeat and the watchdog (only once, on_ready is called again on reconnects)
+    def start_watchdog():
+        nonlocal watchdog_thread
+        if not watchdog_thread:
+            loop_stats['heartbeat'] = time.monotonic()
+            client.loop.create_task(beat_event_loop())
+            watchdog_thread = threading.Thread(target = watch_event_loop, name = 'watchdog', daemon = True)
+            watchdog_thread.start()
+        return
+
+
+    #--[ METRICS ]-----------------------------------------------------------------------------------------------------
+
+    # latencies along the alert path, always recorded (the endpoint only renders them)
+    #   NOTE: recorded on the event loop only, never from gpiozero's threads, so no locks are needed
+    latency_histograms = {
+        'detection': new_histogram(), # sensor edge until the event loop handles it
+        'post':      new_histogram(), # "done" until the channel post is sent
+        'dm':        new_histogram(), # a DM queued until it's sent
+        'queue':     new_histogram(), # any message queued until its first attempt (its coalescing window, and a free slot)
+    }
+    connection_stats = {
+        'connects':    0, # on_ready and on_resumed, the first is the initial connection
+        'disconnects': 0,
+    }
+    metrics_server = None
+
+    # get every metric, for the metrics endpoint
+    def collect_metrics():
+        return [
+            ('laundromatic_sensor_events_total',          'counter',   'Sensor events handled (light on or off)',                  sensor_stats['received']),
+            ('laundromatic_sensor_events_dropped_total',  'counter',   'Sensor events dropped because the queue was full',         sensor_stats['dropped']),
+            ('laundromatic_completions_total',            'counter',   'Completions sent',                                         sensor_stats['dispatched']),
+            ('laundromatic_completions_suppressed_total', 'counter',   'Completions within the delay of the last one, not sent',   sensor_stats['suppressed']),
+            ('laundromatic_messages_queued_total',        'counter',   'Messages and DMs queued to be sent',                       outbound_stats['queued']),
+            ('laundromatic_messages_deduped_total',       'counter',   'Messages already waiting to be sent, not queued again',    outbound_stats['deduped']),
+            ('laundromatic_messages_coalesced_total',     'counter',   'Messages merged into a digest waiting to be sent',         outbound_stats['coalesced']),
+            ('laundromatic_messages_sent_total',          'counter',   'Messages and DMs sent',                                    outbound_stats['sent']),
+            ('laundromatic_messages_failed_total',        'counter',   'Messages and DMs given up on',                             outbound_stats['failed']),
+            ('laundromatic_message_retries_total',        'counter',   'Attempts to send messages after the first',                outbound_stats['retries']),
+            ('laundromatic_reconnects_total',             'counter',   'Reconnects (resumed or new sessions) to Discord',          max(connection_stats['connects'] - 1, 0)),
+            ('laundromatic_disconnects_total',            'counter',   'Disconnects from Discord',                                 connection_stats['disconnects']),
+            ('laundromatic_watchers',                     'gauge',     'Watchers of any machine',                                  len(get_all_users())),
+            ('laundromatic_guilds',                       'gauge',     'Guilds (servers) the bot is in',                           len(client.guilds)),
+            ('laundromatic_shards',                       'gauge',     'Gateway shards (0 in notifier mode)',                      0 if webhook else client.shard_count or 1),
+            ('laundromatic_outbound_queue_depth',         'gauge',     'Messages waiting to be sent',                              outbound_queue_depth()),
+            ('laundromatic_event_loop_stalls_total',      'counter',   'Times the event loop stalled past the threshold',          loop_stats['stalls']),
+            ('laundromatic_event_loop_lag_seconds',       'gauge',     'Seconds the event loop ran late, at the last measurement', loop_stats['lag']),
+            ('laundromatic_resident_memory_bytes',        'gauge',     'Resident memory of the process',                           round(resident_memory() * 1024 * 1024)),
+            ('laundromatic_detection_latency_seconds',    'histogram', 'Sensor edge until a "done" event is handled',              latency_histograms['detection']),
+            ('laundromatic_post_latency_seconds',         'histogram', 'Completion until the channel post is sent',                latency_histograms['post']),
+            ('laundromatic_dm_latency_seconds',           'histogram', 'DM queued until sent',                                     latency_histograms['dm']),
+            ('laundromatic_queue_time_seconds',           'histogram', 'Message queued until its first attempt to be sent',        latency_histograms['queue']),
+        ]
+
+    # serve the metrics endpoint, until cancelled
+    #   NOTE: served from the bot's own event loop, by aiohttp's server
+    #       (only imported when metrics are served)
+    async def serve_metrics():
+        from aiohttp import web
+
+        # render every metric, for a request to the metrics endpoint
+        async def handle_metrics(request):
+            return web.Response(text = render_metrics(collect_metrics()), content_type = 'text/plain', charset = 'utf-8')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle_metrics)
+        runner = web.AppRunner(app, access_log = None)
+        await runner.setup()
+        try:
+            address = parse_address(metrics)
+            if address[0] == 'unix':
+                site = web.UnixSite(runner, address[1])
+            else:
+                site = web.TCPSite(runner, address[1], address[2])
+            await site.start()
+        except (OSError, ValueError) as e:
+            logger.error('Unable to serve metrics on %s: %s', metrics, e)
+            await runner.cleanup()
+            return
+        logger.info('Serving metrics on %s/metrics', metrics)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    # serve metrics (only once, on_ready is called again on reconnects)
+    def start_metrics():
+        nonlocal metrics_server
+        if metrics and not metrics_server:
+            metrics_server = client.loop.create_task(serve_metrics())
+        return
+
+
+    #--[ GUILDS ]------------------------------------------------------------------------------------------------------
+
+    # keep the channel index current as guilds and channels change
+
+    @client.event
+    async def on_guild_join(guild):
+        index_guild(guild)
+        for member in guild.members:
+            index_member(member)
+        return
+
+    @client.event
+    async def on_guild_remove(guild):
+        unindex_guild(guild)
+        for member in guild.members:
+            reindex_user(member.id, member)
+        return
+
+    @client.event
+    async def on_guild_channel_create(channel_obj):
+        index_channel(channel_obj)
+        return
 
-        # set an online message, log it, and send it to the management channel
-        online_message = f'{client.user.name} is online and watching laundry'
-        logger.info(online_message)
-        await send_channel_message(channel, message = online_message)
+    @client.event
+    async def on_guild_channel_update(before, after):
+        unindex_channel(before)
+        index_channel(after)
+        return
 
-        # if users are present, 
-        #   set their user details and send them all a message too
-        nonlocal users
-        logger.debug(f'nonlocal users: {users}')
-        if users:
-            users = await set_user_details(users)
-            await send_dms(users, message = online_message)
+    @client.event
+    async def on_guild_channel_delete(channel_obj):
+        unindex_channel(channel_obj)
+        return
 
-        # set up the watcher function on the GPIO light sensor
-        light_sensor.when_activated = laundry_done_wrapper
 
+    #--[ MEMBERS ]-----------------------------------------------------------------------------------------------------
+
+    # keep the member indexes current as members join, change names, and leave
+
+    @client.event
+    async def on_member_join(member):
+        index_member(member)
+        return
+
+    @client.event
+    async def on_member_update(before, after):
+        if before.nick != after.nick:
+            reindex_user(after.id, before)
+        return
+
+    @client.event
+    async def on_user_update(before, after):
+        if before.name != after.name:
+            reindex_user(after.id, before)
+            # re-render the user on any watch list they are on
+            for machine in machines.values():
+                if str(after.id) in machine['users']:
+                    set_watcher(machine, str(after.id), after)
+        return
+
+    @client.event
+    async def on_member_remove(member):
+        reindex_user(member.id, member)
+        return
+
+
+    #--[ CONNECT ]-----------------------------------------------------------------------------------------------------
+
+    @client.event
+    async def on_connect():
+        end_startup_phase('login')
+        return
+
+    # with shards, each shard connects on its own (on_ready is only called once every shard is ready)
+    @client.event
+    async def on_shard_ready(shard_id):
+        logger.info('Shard %s/%s is ready', shard_id + 1, client.shard_count)
+        return
+
+
+    #--[ RESUMED ]-----------------------------------------------------------------------------------------------------
+
+    @client.event
+    async def on_resumed():
+        logger.info('%s resumed its session with Discord', client.user)
+        connection_stats['connects'] += 1
+        # send anything left in the outbox from while disconnected
+        await deliver_outbox()
         return
 
 
@@ -406,7 +2701,8 @@ def main(args):
 
     @client.event
     async def on_disconnect():
-        logger.warning(f'{client.user} disconnected from Discord')
+        logger.warning('%s disconnected from Discord', client.user)
+        connection_stats['disconnects'] += 1
         return
 
 
@@ -415,9 +2711,9 @@ def main(args):
     @client.event
     async def on_error(event, *args, **kwargs):
         message = args[0]
-        logger.error(f'Error Message: {message}\n{traceback.format_exc()}')
+        logger.error('Error Message: %s\n%s', message, traceback.format_exc())
         error_message  = f'{client.user} has encountered an error. Check server log for details.' 
-        await send_dms(users, message = error_message)
+        await send_dms(get_all_users(), message = error_message, priority = priority_alert)
         return
 
 
@@ -434,11 +2730,24 @@ def main(args):
         #   NOTE: required when using the on_message event
         await client.process_commands(message)
 
-    if token:
+    if token and webhook:
+        run_notifier()
+    elif token:
         client.run(token)
     else:
         logger.error('No token provided')
 
+    # release the GPIO pins and the watcher store
+    for machine in machines.values():
+        if machine['sensor']:
+            machine['sensor'].close()
+    database_executor.shutdown()
+    watcher_store.close()
+    outbox.close()
+    history.close()
+    if trace:
+        trace['file'].close()
+
     return
 
 
@@ -446,6 +2755,8 @@ def main(args):
 
 if __name__ == "__main__":
 
+    end_startup_phase('import')
+
     # important values
     token    = None # REQUIRED
     channel  = None # Defaults in main() to '#laundromatic'
@@ -454,6 +2765,20 @@ if __name__ == "__main__":
     loglevel = None # Defaults in main() to 'info'
     prefix   = None # Defaults in main() to '!'   
     watchers = []   # Optional - user IDs
+    concurrency = None # Defaults in main() to '10' (DMs sent at once)
+    machines = {}   # Optional - machine names to GPIO pins (and settings), defaults in main() to one machine
+    detector = None # Optional - signal detector settings, defaults in main() to treating every edge as "done"
+    lowmemory = None # Optional - defaults in main() to caching every member (needs the SERVER MEMBERS INTENT)
+    webhook  = None # Optional - webhook URL, runs without a gateway session (no commands) and posts through it
+    listen   = None # Optional - address to listen for sensor agents on, instead of watching GPIO pins
+    secret   = None # Optional - secret shared with sensor agents, required to listen on TCP
+    coalesce = None # Defaults in main() to '5' (seconds alerts to the same destination are merged for)
+    notice   = None # Defaults in main() to '10' (minutes before a cycle should be done that watchers are told)
+    metrics  = None # Optional - address to serve metrics on ("host:port"), defaults in main() to not serving them
+    record   = None # Optional - trace file to record raw sensor edges to, for replay.py
+    startupprofile = None # Optional - defaults in main() to not logging how long each phase of startup took
+    guilds   = None # Optional - settings of each guild, by guild ID (config file only), defaults in main() to none
+    shards   = None # Optional - number of shards, or "auto", defaults in main() to a single connection without sharding
 
     # the above values get set from (in order):
     #   1. JSON config file
@@ -465,31 +2790,28 @@ if __name__ == "__main__":
 
     #--[ 1. JSON CONFIG ]----------------------------------------------------------------------------------------------
 
-    config_file = 'config.json'
-    if os.path.exists(config_file):
-        with open(config_file) as json_config_file:
-            config = json.load(json_config_file)
-            if 'token'    in config:
-                token     = config['token']
-
-            if 'channel'  in config:
-                channel   = config['channel']
-
-            if 'delay'    in config:
-                delay     = config['delay']
-
-            if 'gpiopin'  in config:
-                gpiopin   = config['gpiopin']
-
-            if 'loglevel' in config:
-                loglevel  = config['loglevel']
-
-            if 'prefix'   in config:
-                prefix    = config['prefix']
-
-            if 'watchers' in config:
-                if all(config['watchers']):
-                    watchers = config['watchers']
+    config      = read_config()
+    token       = config.get('token',       token)
+    channel     = config.get('channel',     channel)
+    delay       = config.get('delay',       delay)
+    gpiopin     = config.get('gpiopin',     gpiopin)
+    loglevel    = config.get('loglevel',    loglevel)
+    prefix      = config.get('prefix',      prefix)
+    watchers    = config.get('watchers',    watchers)
+    concurrency = config.get('concurrency', concurrency)
+    detector    = config.get('detector',    detector)
+    listen      = config.get('listen',      listen)
+    secret      = config.get('secret',      secret)
+    webhook     = config.get('webhook',     webhook)
+    lowmemory   = config.get('lowmemory',   lowmemory)
+    coalesce    = config.get('coalesce',    coalesce)
+    notice      = config.get('notice',      notice)
+    metrics     = config.get('metrics',     metrics)
+    record      = config.get('record',      record)
+    startupprofile = config.get('startupprofile', startupprofile)
+    guilds      = config.get('guilds',      guilds)
+    shards      = config.get('shards',      shards)
+    machines    = config.get('machines',    machines)
 
 
     #--[ 2. ENVIRONMENT VARIABLES ]------------------------------------------------------------------------------------
@@ -517,6 +2839,48 @@ if __name__ == "__main__":
         if watchers:
             watchers = watchers.split() # convert space separated string to list
 
+    if not concurrency:
+        concurrency = os.environ.get('LAUNDROMATIC_CONCURRENCY')
+        if concurrency:
+            concurrency = int(concurrency)
+
+    if not webhook:
+        webhook  = os.environ.get('LAUNDROMATIC_WEBHOOK')
+
+    if not listen:
+        listen   = os.environ.get('LAUNDROMATIC_LISTEN')
+
+    if not secret:
+        secret   = os.environ.get('LAUNDROMATIC_SECRET')
+
+    if not lowmemory:
+        lowmemory = os.environ.get('LAUNDROMATIC_LOWMEMORY', '').lower() in ('1', 'true', 'yes', 'on')
+
+    if coalesce is None:
+        coalesce = os.environ.get('LAUNDROMATIC_COALESCE')
+        coalesce = float(coalesce) if coalesce else None
+
+    if notice is None:
+        notice   = os.environ.get('LAUNDROMATIC_NOTICE')
+        notice   = int(notice) if notice else None
+
+    if not metrics:
+        metrics  = os.environ.get('LAUNDROMATIC_METRICS')
+
+    if not record:
+        record   = os.environ.get('LAUNDROMATIC_RECORD')
+
+    if not startupprofile:
+        startupprofile = os.environ.get('LAUNDROMATIC_STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes', 'on')
+
+    if not shards:
+        shards   = parse_shards(os.environ.get('LAUNDROMATIC_SHARDS'))
+
+    if not machines:
+        machines = os.environ.get('LAUNDROMATIC_MACHINES')
+        if machines:
+            machines = dict(parse_machine(machine) for machine in machines.split()) # space separated "name=gpiopin" list
+
 
     #--[ 3. COMMAND LINE ARGUMENTS ]-----------------------------------------------------------------------------------
 
@@ -545,7 +2909,7 @@ if __name__ == "__main__":
                         '--channel',
                         dest = 'channel',
                         type = str,
-                        help = 'Channel Name for management')
+                        help = 'Channel Name (or ID) for management')
 
     # delay
     def set_delay_timedelta(minutes):
@@ -610,6 +2974,88 @@ if __name__ == "__main__":
                                 nargs   = '+',
                                 help    = 'User IDs for Watchers (space separated list)')
 
+    # machines
+    parser.add_argument('-m',
+                        '--machine',
+                        dest    = 'machines',
+                        type    = parse_machine,
+                        action  = 'append',
+                        help    = 'Machine name and GPIO pin as "name=gpiopin" (can be used multiple times)')
+
+    # detector
+    parser.add_argument('--detector',
+                        dest    = 'detector',
+                        action  = 'store_true',
+                        default = None,
+                        help    = 'Sample the sensor through a signal detector, instead of treating every edge as "done"')
+
+    # sensor agents
+    parser.add_argument('--listen',
+                        dest = 'listen',
+                        type = str,
+                        help = 'Address to listen for sensor agents on ("unix:/path/to/socket" or "host:port"), instead of watching GPIO pins')
+
+    parser.add_argument('--secret',
+                        dest = 'secret',
+                        type = str,
+                        help = 'Secret shared with sensor agents, to check their HELLO against (required to listen on TCP)')
+
+    # webhook (notifier mode)
+    parser.add_argument('--webhook',
+                        dest = 'webhook',
+                        type = str,
+                        help = 'Webhook URL to post completions to, without a gateway session (no bot commands)')
+
+    # low-memory mode
+    parser.add_argument('--low-memory',
+                        dest    = 'lowmemory',
+                        action  = 'store_true',
+                        default = None,
+                        help    = 'Don\'t cache guild members, search for usernames when needed instead (no SERVER MEMBERS INTENT needed)')
+
+    # concurrency
+    parser.add_argument('--concurrency',
+                        dest = 'concurrency',
+                        type = int,
+                        help = 'Maximum number of DMs to send at once')
+
+    # coalesce
+    parser.add_argument('--coalesce',
+                        dest = 'coalesce',
+                        type = float,
+                        help = 'Seconds to merge alerts to the same channel or user into one message (0 to turn off)')
+
+    # notice
+    parser.add_argument('--notice',
+                        dest = 'notice',
+                        type = int,
+                        help = 'Minutes before a cycle should be done to DM watchers (0 to turn off)')
+
+    # metrics
+    parser.add_argument('--metrics',
+                        dest = 'metrics',
+                        type = str,
+                        help = 'Address to serve Prometheus metrics on, at /metrics ("host:port" or "unix:/path/to/socket")')
+
+    # record
+    parser.add_argument('--record',
+                        dest = 'record',
+                        type = str,
+                        help = 'Path of a trace file to record every raw edge of the sensors to (appended to if it exists), for replay.py')
+
+    # startup profile
+    parser.add_argument('--startup-profile',
+                        dest    = 'startupprofile',
+                        action  = 'store_true',
+                        default = None,
+                        help    = 'Log how long each phase of startup took (import, config, gpio, client, login, ready)')
+
+    # shards
+    parser.add_argument('--shards',
+                        dest = 'shards',
+                        type = parse_shards,
+                        help = 'Number of shards to split the gateway connection into, or "auto" for as many as Discord recommends')
+
 
     # parse arguments
     args, unknown = parser.parse_known_args()
@@ -622,6 +3068,20 @@ if __name__ == "__main__":
     args.loglevel   = args.loglevel or loglevel
     args.prefix     = args.prefix   or prefix
     args.watchers   = args.watchers or watchers
+    args.concurrency = args.concurrency or concurrency
+    args.machines   = dict(args.machines or []) or machines
+    args.detector   = args.detector or detector
+    args.lowmemory  = args.lowmemory or lowmemory
+    args.webhook    = args.webhook  or webhook
+    args.listen     = args.listen   or listen
+    args.secret     = args.secret   or secret
+    args.coalesce   = args.coalesce if args.coalesce is not None else coalesce
+    args.notice     = args.notice   if args.notice   is not None else notice
+    args.metrics    = args.metrics  or metrics
+    args.record     = args.record   or record
+    args.startupprofile = args.startupprofile or startupprofile
+    args.guilds     = guilds
+    args.shards     = args.shards   or shards
 
     # pass all args to main
     main(args)
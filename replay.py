@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+purpose: Replay sensor traces through Laundromatic's "done" detection, offline.
+    Traces are recorded by the bot or the sensor agent with --record,
+        and hold every raw edge of the sensors (see TRACES in sensor_agent.py).
+    Each machine's edges are fed through the same detection as the bot, in virtual time:
+        - every rising edge is "done", or the edges are sampled through the signal detector (--detector)
+        - "done" within the delay of the one before is suppressed, as the bot does
+    Runs as fast as it can, or at --speed times real time (printing completions as they happen).
+    No Raspberry Pi, Discord token or connection is needed.
+
+    Reports, for each machine:
+        - edges, completions detected, and completions suppressed by the delay
+        - with --truth, completions matched to the truth file, false positives, and missed completions
+
+author: Jeff Reeves
+"""
+
+
+#==[ IMPORTS ]=============================================================================================================================
+
+import sys
+import json
+import time
+import heapq
+import argparse
+from datetime import datetime
+from sensor_agent import detector_defaults, make_signal_detector, read_trace, event_done
+
+
+#==[ CONFIG ]==============================================================================================================================
+
+delay_default     = 30   # minutes, between completions of a machine (as in the bot)
+tolerance_default = 120  # seconds a detected completion may be from the truth, and still match it
+speed_max         = 1000 # times real time, at most
+
+
+#==[ REPLAY ]==============================================================================================================================
+
+# replay the edges of a machine through its "done" detection
+#   edges:    [ (unix time in microseconds, value), ... ] in order
+#   delay:    seconds between completions, any "done" sooner is suppressed
+#   detector: signal detector settings, or None to treat every rising edge as "done"
+#   NOTE: the signal detector is sampled in virtual time, as the sampler thread would in real time.
+#       Once the input has been constant for a full window (and the sustain after it), the detector can't change again,
+#       so only that many samples are run after each edge, and the rest of the gap is skipped.
+#   yields (unix time in seconds, suppressed) for each "done", in order
+def replay_machine(edges, delay, detector = None):
+    done_last = float('-inf')
+
+    def done(timestamp):
+        nonlocal done_last
+        if timestamp - done_last > delay:
+            done_last = timestamp
+            return (timestamp, False)
+        return (timestamp, True)
+
+    if not detector:
+        for timestamp, value in edges:
+            if value:
+                yield done(timestamp / 1e6)
+        return
+
+    detect   = make_signal_detector(**detector)
+    interval = 1 / detector['rate']
+    settle   = max(1, int(detector['window'] * detector['rate'])) + max(1, int(detector['sustain'] * detector['rate'])) + 1
+    if not edges:
+        return
+
+    # the sampler records an edge when a sample differs from the one before, so the signal was the opposite until the first edge
+    sample_time = edges[0][0] / 1e6
+    value       = 1 - edges[0][1]
+    for timestamp, next_value in edges + [ (edges[-1][0] + int(settle * interval * 1e6), None) ]:
+        timestamp = timestamp / 1e6
+        samples   = max(0, int((timestamp - sample_time) / interval + 0.999999))
+        for sample in range(min(samples, settle)):
+            if detect(value) == event_done:
+                yield done(sample_time + sample * interval)
+        sample_time += samples * interval
+        value        = next_value
+    return
+
+# replay every machine of a trace, merging their completions in order of time
+#   settings: { machine name: (delay in seconds, detector settings or None) }
+#   yields (unix time in seconds, machine name, suppressed)
+def replay_trace(edges, settings):
+    def tag(name):
+        delay, detector = settings[name]
+        for timestamp, suppressed in replay_machine(edges[name], delay, detector):
+            yield (timestamp, name, suppressed)
+        return
+    yield from heapq.merge(*(tag(name) for name in edges))
+    return
+
+# match detected completions to the truth, each at most once, earliest first
+#   returns (matched, false positives, missed)
+def match_completions(detected, truth, tolerance):
+    matched = 0
+    index   = 0
+    for timestamp in sorted(truth):
+        while index < len(detected) and detected[index] < timestamp - tolerance:
+            index += 1
+        if index < len(detected) and detected[index] <= timestamp + tolerance:
+            matched += 1
+            index   += 1
+    return (matched, len(detected) - matched, len(truth) - matched)
+
+
+#==[ HELPERS ]=============================================================================================================================
+
+# read a truth file, with a completion on each line as "<unix time or ISO 8601 time> [machine]"
+#   NOTE: blank lines and lines starting with "#" are skipped, and ISO 8601 times without a timezone are local
+#   returns { machine name (or None, for every machine): [ unix time in seconds, ... ] }
+def read_truth(path):
+    truth = {}
+    with open(path) as truth_file:
+        for number, line in enumerate(truth_file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            timestamp, _, machine = line.partition(' ')
+            try:
+                timestamp = float(timestamp)
+            except ValueError:
+                try:
+                    timestamp = datetime.fromisoformat(timestamp).timestamp()
+                except ValueError:
+                    raise ValueError(f'{path}:{number}: not a unix or ISO 8601 time: {timestamp}')
+            truth.setdefault(machine.strip() or None, []).append(timestamp)
+    return truth
+
+# get the delay (seconds) and detector settings of a machine, from the command line and a config file
+#   NOTE: as in the bot, the delay is the machine's own, then that of the guild it's bound to (the first to list it),
+#       then the config file's, and the detector is the machine's own, then the config file's.
+#       Settings in the config file win over the command line
+def machine_settings(name, config, delay, detector):
+    machine = config.get('machines', {}).get(name, {})
+    machine = machine if isinstance(machine, dict) else {}
+    guild   = next((guild for guild in config.get('guilds', {}).values() if name in (guild.get('machines') or [])), {})
+    delay   = float(machine.get('delay') or guild.get('delay') or config.get('delay') or delay) * 60
+    setting = machine.get('detector', config.get('detector', detector))
+    if setting:
+        setting = { **detector_defaults, **(setting if isinstance(setting, dict) else {}) }
+    return (delay, setting or None)
+
+# format a unix time for the report
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+#==[ COMMAND LINE ]========================================================================================================================
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = 'Replay sensor traces through Laundromatic\'s "done" detection, offline')
+
+    parser.add_argument('trace',
+                        type    = str,
+                        help    = 'Path of a trace file, recorded with --record')
+
+    parser.add_argument('-d',
+                        '--delay',
+                        dest    = 'delay',
+                        type    = float,
+                        default = delay_default,
+                        help    = f'Minutes between completions of a machine (default {delay_default})')
+
+    parser.add_argument('--detector',
+                        dest    = 'detector',
+                        action  = 'store_true',
+                        help    = 'Sample the edges through the signal detector, instead of treating every edge as "done"')
+
+    parser.add_argument('--config',
+                        dest    = 'config',
+                        type    = str,
+                        help    = 'Path of a config.json to take the delay and detector settings (and those of each guild and machine) from')
+
+    parser.add_argument('-m',
+                        '--machine',
+                        dest    = 'machines',
+                        type    = str,
+                        action  = 'append',
+                        help    = 'Only replay this machine (can be used multiple times)')
+
+    parser.add_argument('-s',
+                        '--speed',
+                        dest    = 'speed',
+                        type    = float,
+                        help    = f'Replay at this many times real time (1 - {speed_max}), instead of as fast as possible')
+
+    parser.add_argument('-t',
+                        '--truth',
+                        dest    = 'truth',
+                        type    = str,
+                        help    = 'Path of a file with the real completions, as "<unix or ISO 8601 time> [machine]" on each line')
+
+    parser.add_argument('--tolerance',
+                        dest    = 'tolerance',
+                        type    = float,
+                        default = tolerance_default,
+                        help    = f'Seconds a completion may be from the truth, and still match it (default {tolerance_default})')
+
+    parser.add_argument('-v',
+                        '--verbose',
+                        dest    = 'verbose',
+                        action  = 'store_true',
+                        help    = 'Print every completion, not just the report')
+
+    args = parser.parse_args()
+    if args.speed is not None and not 1 <= args.speed <= speed_max:
+        parser.error(f'the speed must be from 1 to {speed_max}')
+
+    config = {}
+    if args.config:
+        with open(args.config) as json_config_file:
+            config = json.load(json_config_file)
+
+    # group the edges by machine
+    edges = {}
+    try:
+        for timestamp, machine, value in read_trace(args.trace):
+            if not args.machines or machine in args.machines:
+                edges.setdefault(machine, []).append((timestamp, value))
+    except (OSError, ValueError) as e:
+        sys.exit(f'Unable to read trace {args.trace}: {e}')
+    if not edges:
+        sys.exit(f'No edges to replay in {args.trace}')
+
+    try:
+        truth = read_truth(args.truth) if args.truth else None
+    except (OSError, ValueError) as e:
+        sys.exit(f'Unable to read truth {args.truth}: {e}')
+
+    settings = { name: machine_settings(name, config, args.delay, args.detector) for name in edges }
+    detected = { name: [] for name in edges }
+    counts   = { name: { 'completions': 0, 'suppressed': 0 } for name in edges }
+
+    # replay, sleeping between completions to keep pace with virtual time at the given speed
+    started      = time.monotonic()
+    trace_start  = min(machine_edges[0][0] for machine_edges in edges.values()) / 1e6
+    for timestamp, name, suppressed in replay_trace(edges, settings):
+        if args.speed:
+            pause = started + (timestamp - trace_start) / args.speed - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+        if suppressed:
+            counts[name]['suppressed'] += 1
+        else:
+            counts[name]['completions'] += 1
+            detected[name].append(timestamp)
+        if args.verbose or args.speed:
+            print(f'{format_time(timestamp)}  {name:<16} {"suppressed" if suppressed else "done"}', flush = True)
+    elapsed = time.monotonic() - started
+
+    # report
+    trace_end = max(machine_edges[-1][0] for machine_edges in edges.values()) / 1e6
+    print(f'trace:    {args.trace}')
+    print(f'span:     {format_time(trace_start)} - {format_time(trace_end)} ({trace_end - trace_start:.0f}s)')
+    print(f'replayed: {elapsed:.3f}s ({(trace_end - trace_start) / max(elapsed, 1e-9):.0f}x real time)')
+    print()
+    columns = [ 'machine', 'mode', 'edges', 'completions', 'suppressed' ]
+    if truth is not None:
+        columns += [ 'matched', 'false positives', 'missed' ]
+    rows = []
+    for name in sorted(edges):
+        delay, detector = settings[name]
+        row = [ name,
+                'detector' if detector else 'edge',
+                len(edges[name]),
+                counts[name]['completions'],
+                counts[name]['suppressed'] ]
+        if truth is not None:
+            # completions without a machine are the truth of every machine
+            row += match_completions(detected[name], truth.get(name, []) + truth.get(None, []), args.tolerance)
+        rows.append(row)
+    widths = [ max(len(str(value)) for value in column) for column in zip(columns, *rows) ]
+    for row in [ columns ] + rows:
+        print('  '.join(str(value).ljust(width) if index < 2 else str(value).rjust(width)
+                        for index, (value, width) in enumerate(zip(row, widths))).rstrip())
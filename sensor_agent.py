@@ -0,0 +1,601 @@
+#!/usr/bin/env python3
+"""
+purpose: Sensor agent for Laundromatic.
+    Owns the GPIO light sensors, and streams timestamped events
+        to the bot over a Unix or TCP socket.
+    Keeps sensing on a process of its own, so a stalled bot never delays it,
+        and lets sensors on several Raspberry Pis feed one bot.
+
+    Also home to what the bot and the agent share:
+        the socket protocol, the signal detector, sampling, and sensor traces.
+
+author: Jeff Reeves
+"""
+
+
+#==[ IMPORTS ]=============================================================================================================================
+
+import os
+import sys
+import time
+import hmac
+import hashlib
+import struct
+import asyncio
+import argparse
+import logging
+import socket
+import threading
+import itertools
+import collections
+import signal
+
+
+#==[ CONFIG ]==============================================================================================================================
+
+logger = logging.getLogger(__name__)
+
+# name of the machine watched when no machines are configured
+default_machine = 'laundry'
+
+# events kept for replay until the bot acknowledges them, at most (oldest are dropped first)
+replay_buffer_size = 1024
+
+# seconds to wait before reconnecting to the bot, doubled after each failure up to the maximum
+reconnect_delay     = 1.0
+reconnect_delay_max = 30.0
+
+# seconds either side waits for the other's CHALLENGE, HELLO or first ACK before disconnecting
+handshake_timeout = 10.0
+
+# sensor traces
+trace_header       = struct.Struct('!4sBQ') # magic, version, unix time (microseconds) the trace starts at
+trace_magic        = b'LTRC'
+trace_version      = 1
+trace_machine      = 0xFF                   # record type of a machine name, any other type is an edge
+trace_machines_max = 127                    # machines in a trace, at most (an edge's type holds the machine's index)
+
+
+#==[ PROTOCOL ]============================================================================================================================
+
+# every frame is a header, followed by a body of the given length
+#   bot -> agent: CHALLENGE once connected
+#   agent -> bot: HELLO after the CHALLENGE, then EVENTs (replayed ones first)
+#   bot -> agent: ACK after the HELLO (with the last sequence number it has handled from this agent),
+#       then an ACK for each event handled
+#   NOTE: sequence numbers start from 1 for each run of the agent (its session),
+#       so the bot tracks them per agent name and session
+#   NOTE: the HELLO is signed with the secret the bot and its agents share
+#       (HMAC-SHA256 of the CHALLENGE's nonce, the session and the agent name), and the bot disconnects an agent whose
+#       signature doesn't match. The secret itself is never sent, and the nonce is new for every connection,
+#       so a HELLO captured off the network can't be used to connect again
+frame_header   = struct.Struct('!HB')   # body length, frame type
+challenge_body = struct.Struct('!16s')  # nonce
+hello_body     = struct.Struct('!Q32s') # session, signature, followed by the agent name (UTF-8)
+event_body     = struct.Struct('!QdB')  # sequence number, unix time of the event, event kind, followed by the machine name (UTF-8)
+ack_body       = struct.Struct('!Q')    # last sequence number handled
+
+# frame types
+frame_hello     = 1
+frame_event     = 2
+frame_ack       = 3
+frame_challenge = 4
+
+# event kinds
+event_edge = 0 # the sensor saw light
+event_done = 1 # the signal detector decided the machine is "done"
+event_off  = 2 # the light went out (or the signal detector's duty cycle fell back to "off")
+
+event_names = { event_edge: 'edge', event_done: 'done', event_off: 'off' }
+
+def encode_frame(frame_type, body):
+    return frame_header.pack(len(body), frame_type) + body
+
+# sign a HELLO with the shared secret, for the nonce of the bot's CHALLENGE
+def sign_hello(secret, nonce, session, name):
+    return hmac.new((secret or '').encode('utf-8'), nonce + session.to_bytes(8, 'big') + name.encode('utf-8'), hashlib.sha256).digest()
+
+def encode_challenge(nonce):
+    return encode_frame(frame_challenge, challenge_body.pack(nonce))
+
+def encode_hello(session, name, nonce, secret = None):
+    return encode_frame(frame_hello, hello_body.pack(session, sign_hello(secret, nonce, session, name)) + name.encode('utf-8'))
+
+def encode_event(sequence, timestamp, kind, machine):
+    return encode_frame(frame_event, event_body.pack(sequence, timestamp, kind) + machine.encode('utf-8'))
+
+def encode_ack(sequence):
+    return encode_frame(frame_ack, ack_body.pack(sequence))
+
+# returns the nonce
+def decode_challenge(body):
+    return challenge_body.unpack(body)[0]
+
+# returns (session, agent name), or raises ValueError if the HELLO isn't signed with the shared secret for the nonce
+def decode_hello(body, nonce, secret = None):
+    if len(body) < hello_body.size:
+        raise ValueError(f'HELLO is {len(body)} bytes, too short to be signed')
+    session, signature = hello_body.unpack_from(body)
+    name               = body[hello_body.size:].decode('utf-8')
+    if not hmac.compare_digest(signature, sign_hello(secret, nonce, session, name)):
+        raise ValueError(f'HELLO from {name} is not signed with the shared secret')
+    return (session, name)
+
+# returns (sequence number, unix time, event kind, machine name)
+def decode_event(body):
+    sequence, timestamp, kind = event_body.unpack_from(body)
+    return (sequence, timestamp, kind, body[event_body.size:].decode('utf-8'))
+
+# returns the last sequence number handled
+def decode_ack(body):
+    return ack_body.unpack(body)[0]
+
+# read a single frame
+#   returns (frame type, body)
+#   raises asyncio.IncompleteReadError if the connection is closed part way
+async def read_frame(reader):
+    length, frame_type = frame_header.unpack(await reader.readexactly(frame_header.size))
+    return (frame_type, await reader.readexactly(length))
+
+# parse a socket address given as "unix:/path/to/socket" or "host:port"
+#   NOTE: without a host (":port"), it's the loopback address, so nothing listens on every interface unless told to
+#   returns ('unix', path) or ('tcp', host, port)
+def parse_address(address):
+    if address.startswith('unix:'):
+        return ('unix', address[len('unix:'):])
+    host, separator, port = address.rpartition(':')
+    if not separator or not port.isdecimal():
+        raise ValueError(f'Address must be given as "unix:/path/to/socket" or "host:port": {address}')
+    return ('tcp', host or '127.0.0.1', int(port))
+
+# connect to the bot
+async def open_connection(address):
+    address = parse_address(address)
+    if address[0] == 'unix':
+        return await asyncio.open_unix_connection(address[1])
+    reader, writer = await asyncio.open_connection(address[1], address[2])
+    writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return (reader, writer)
+
+# listen for agents, calling `handler(reader, writer)` for each connection
+#   NOTE: a socket file left behind by a previous run is removed first
+async def start_server(handler, address):
+    address = parse_address(address)
+    if address[0] == 'unix':
+        if os.path.exists(address[1]):
+            os.unlink(address[1])
+        return await asyncio.start_unix_server(handler, address[1])
+    return await asyncio.start_server(handler, address[1], address[2])
+
+
+#==[ SIGNAL DETECTOR ]=====================================================================================================================
+
+# default settings for the signal detector
+#   rate:    samples per second
+#   window:  seconds of samples the duty cycle is measured over
+#   on:      duty cycle (0 - 1) the window must reach to count as "done"
+#   off:     duty cycle (0 - 1) the window must fall to before "done" can be detected again
+#   sustain: seconds the duty cycle must stay at or above "on" before counting as "done"
+detector_defaults = {
+    'rate':    20,
+    'window':  5,
+    'on':      0.5,
+    'off':     0.1,
+    'sustain': 2,
+}
+
+# create a detector that decides when a machine is "done" from sensor samples,
+#   instead of treating every rising edge as "done"
+#   NOTE: samples are kept in a fixed-size ring buffer with a running count of "on" samples,
+#       so each sample costs the same no matter how large the window is.
+#       Blinking LEDs and chatter keep the duty cycle between the thresholds,
+#       and the hysteresis between "on" and "off" stops them from re-triggering.
+# returns a function that takes a sample (truthy when lit), and returns
+#   event_done for the sample where "done" is first detected,
+#   event_off for the sample where the signal falls back to "off" after that, or None
+def make_signal_detector(rate     = detector_defaults['rate'],
+                         window   = detector_defaults['window'],
+                         on       = detector_defaults['on'],
+                         off      = detector_defaults['off'],
+                         sustain  = detector_defaults['sustain']):
+
+    size            = max(1, int(window * rate))
+    sustain_samples = max(1, int(sustain * rate))
+    samples         = bytearray(size)
+    index           = 0
+    on_count        = 0
+    sustained       = 0
+    done            = False
+
+    def detect(value):
+        nonlocal index, on_count, sustained, done
+
+        # replace the oldest sample in the ring buffer, and update the running count
+        value            = 1 if value else 0
+        on_count        += value - samples[index]
+        samples[index]   = value
+        index            = (index + 1) % size
+        duty_cycle       = on_count / size
+
+        # already "done", wait for the signal to drop below the "off" threshold
+        if done:
+            if duty_cycle <= off:
+                done      = False
+                sustained = 0
+                return event_off
+            return None
+
+        # not "done" yet, wait for the signal to stay above the "on" threshold
+        if duty_cycle >= on:
+            sustained += 1
+            if sustained >= sustain_samples:
+                done = True
+                return event_done
+        else:
+            sustained = 0
+        return None
+
+    return detect
+
+
+#==[ SAMPLING ]============================================================================================================================
+
+# sample a sensor at a fixed rate, passing the samples through a signal detector
+#   NOTE: blocks until the sensor is closed, so it must run on a thread of its own.
+#       `done` is called (on that thread) when the detector decides the machine is "done",
+#       and `off` when the signal falls back to "off" after that.
+#       `edge` is called with the new value whenever a sample differs from the one before, for recording traces
+def sample_signal(sensor, settings, done, off = None, edge = None):
+    detect      = make_signal_detector(**settings)
+    interval    = 1 / settings['rate']
+    next_sample = time.monotonic()
+    last        = None
+    while not sensor.closed:
+        value = sensor.value
+        if edge and value != last and last is not None:
+            edge(value)
+        last  = value
+        event = detect(value)
+        if event == event_done:
+            done()
+        elif event == event_off and off:
+            off()
+        next_sample += interval
+        delay = next_sample - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # fell behind, skip the missed samples instead of catching up
+            next_sample = time.monotonic()
+    return
+
+
+#==[ TRACES ]==============================================================================================================================
+
+# a trace is a header, followed by records of the raw edges of any number of machines:
+#   machine: trace_machine, name length, name (UTF-8), giving the machine the next index (from 0)
+#   edge:    machine index << 1 | value (1 when lit), microseconds since the record before (varint)
+#   NOTE: timestamps are deltas, so most edges take 4 or 5 bytes, and a trace can be appended to across runs
+
+# encode a non-negative integer as a varint (7 bits per byte, least significant first)
+def encode_varint(number):
+    encoded = bytearray()
+    while number > 0x7F:
+        encoded.append(number & 0x7F | 0x80)
+        number >>= 7
+    encoded.append(number)
+    return bytes(encoded)
+
+# decode the records of a trace
+#   NOTE: a record cut short (by a crash while writing) ends the trace
+#   yields (position after the record, unix time in microseconds, machine name, value) for each edge
+def decode_trace(data):
+    if len(data) < trace_header.size:
+        raise ValueError('Not a sensor trace, too short')
+    magic, version, timestamp = trace_header.unpack_from(data)
+    if magic != trace_magic or version != trace_version:
+        raise ValueError(f'Not a version {trace_version} sensor trace')
+    machines = []
+    position = trace_header.size
+    try:
+        while position < len(data):
+            record    = data[position]
+            position += 1
+            if record == trace_machine:
+                length = data[position]
+                name   = data[position + 1:position + 1 + length]
+                if len(name) < length:
+                    return
+                machines.append(name.decode('utf-8'))
+                position += 1 + length
+                continue
+            delta = shift = 0
+            while True:
+                byte      = data[position]
+                position += 1
+                delta    |= (byte & 0x7F) << shift
+                shift    += 7
+                if not byte & 0x80:
+                    break
+            timestamp += delta
+            yield (position, timestamp, machines[record >> 1], record & 1)
+    except IndexError:
+        pass
+    return
+
+# read every edge of a trace
+#   yields (unix time in microseconds, machine name, value)
+def read_trace(path):
+    with open(path, 'rb') as trace_file:
+        data = trace_file.read()
+    for position, timestamp, machine, value in decode_trace(data):
+        yield (timestamp, machine, value)
+    return
+
+# open a trace to record edges to, appending to it if it already exists
+#   NOTE: edges come from gpiozero's callback thread and sampler threads, so records are written under a lock,
+#       each with a single unbuffered write, so nothing recorded is lost if the process dies
+#       (a record cut short by that is dropped before appending)
+#   returns a trace for record_edge()
+def open_trace(path):
+    machines  = {}
+    timestamp = time.time_ns() // 1000
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, 'rb') as trace_file:
+            data = trace_file.read()
+        end, timestamp = trace_header.size, None
+        for end, timestamp, machine, value in decode_trace(data):
+            machines.setdefault(machine, len(machines))
+        if timestamp is None:
+            timestamp = trace_header.unpack_from(data)[2]
+        trace_file = open(path, 'r+b', buffering = 0)
+        trace_file.truncate(end)
+        trace_file.seek(end)
+    else:
+        trace_file = open(path, 'wb', buffering = 0)
+        trace_file.write(trace_header.pack(trace_magic, trace_version, timestamp))
+    return { 'file': trace_file, 'lock': threading.Lock(), 'machines': machines, 'last': timestamp }
+
+# record a single edge of a machine to a trace
+def record_edge(trace, machine, value):
+    with trace['lock']:
+        record = b''
+        index  = trace['machines'].get(machine)
+        if index is None:
+            if len(trace['machines']) >= trace_machines_max:
+                return
+            index  = trace['machines'][machine] = len(trace['machines'])
+            name   = machine.encode('utf-8')[:255]
+            record = bytes((trace_machine, len(name))) + name
+        now           = time.time_ns() // 1000
+        delta         = max(0, now - trace['last']) # the clock may step back
+        trace['last'] = trace['last'] + delta
+        trace['file'].write(record + bytes((index << 1 | (1 if value else 0),)) + encode_varint(delta))
+    return
+
+
+#==[ HELPERS ]=============================================================================================================================
+
+# parse a machine given as "name=gpiopin"
+def parse_machine(value):
+    name, separator, gpiopin = value.partition('=')
+    if not separator or not name or not gpiopin.isdecimal():
+        raise ValueError(f'Machine must be given as "name=gpiopin": {value}')
+    return (name, { 'gpiopin': int(gpiopin) })
+
+
+#==[ AGENT ]===============================================================================================================================
+
+# run the agent, until cancelled
+#   1. the sensor of each machine is armed right away, and every event is timestamped as it happens,
+#       numbered, and kept until the bot acknowledges it
+#   2. the agent connects to the bot (reconnecting with backoff whenever the connection drops),
+#       and on each connection replays every event the bot hasn't acknowledged yet
+#   3. with a trace path, every raw edge of the sensors is also recorded to it (see open_trace())
+#   NOTE: the HELLO is signed with the secret shared with the bot, which is required over TCP
+#   format of machines: { machine name: { 'gpiopin': pin, 'detector': settings (optional) } }
+async def run_agent(connect, machines, name = None, detector = None, record = None, secret = None):
+    loop     = asyncio.get_running_loop()
+    name     = name or socket.gethostname()
+    session  = int.from_bytes(os.urandom(8), 'big')
+    sequence = itertools.count(1)
+    unacked  = collections.deque() # format: [ (sequence number, frame) ], oldest first
+    sensors  = []
+    writer   = None # connection to the bot, once the HELLO and replay are done
+    dropped  = 0
+    trace    = open_trace(record) if record else None
+
+    # number and keep an event, and send it if connected
+    #   NOTE: always called on the event loop
+    def add_event(machine, kind, timestamp):
+        nonlocal dropped
+        if len(unacked) >= replay_buffer_size:
+            unacked.popleft()
+            dropped += 1
+            logger.warning('Replay buffer full, dropped the oldest event (%s dropped in total)', dropped)
+        number = next(sequence)
+        frame  = encode_event(number, timestamp, kind, machine)
+        unacked.append((number, frame))
+        if writer:
+            writer.write(frame)
+        logger.info('Event %s on %s (%s)', number, machine, event_names[kind])
+        return
+
+    # wrapper function to timestamp events for a machine
+    #   NOTE: runs on gpiozero's callback thread (or a sampler thread),
+    #       so it only touches the event loop through call_soon_threadsafe
+    #   NOTE: the value is given for raw edges (1 when lit), to record them
+    def event_wrapper(machine, kind, value = None):
+
+        def event():
+            loop.call_soon_threadsafe(add_event, machine, kind, time.time())
+            if trace and value is not None:
+                record_edge(trace, machine, value)
+            return
+
+        return event
+
+    # wrapper function to record the raw edges of a sampled machine
+    def edge_wrapper(machine):
+
+        def edge(value):
+            record_edge(trace, machine, value)
+            return
+
+        return edge if trace else None
+
+    # forget every event up to the last one the bot has handled
+    def acknowledge(number):
+        while unacked and unacked[0][0] <= number:
+            unacked.popleft()
+        return
+
+    # arm the sensor of each machine
+    #   either sampled through a signal detector, or treating every edge as an event
+    #   NOTE: gpiozero is only imported here, so the bot (which imports this module) and replay.py don't wait on it
+    import gpiozero # type: ignore
+    for machine, settings in machines.items():
+        sensor = gpiozero.DigitalInputDevice(settings['gpiopin'], pull_up = True)
+        sensors.append(sensor)
+        machine_detector = settings.get('detector', detector)
+        if machine_detector:
+            machine_detector = { **detector_defaults, **(machine_detector if isinstance(machine_detector, dict) else {}) }
+            threading.Thread(target = sample_signal,
+                             args   = (sensor, machine_detector, event_wrapper(machine, event_done), event_wrapper(machine, event_off), edge_wrapper(machine)),
+                             name   = f'sampler-{machine}',
+                             daemon = True).start()
+        else:
+            sensor.when_activated   = event_wrapper(machine, event_edge, 1)
+            sensor.when_deactivated = event_wrapper(machine, event_off, 0)
+        logger.info('Watching %s on GPIO pin %s', machine, settings['gpiopin'])
+
+    delay = reconnect_delay
+    try:
+        while True:
+            connection = None
+            try:
+                reader, connection = await open_connection(connect)
+                frame_type, body = await asyncio.wait_for(read_frame(reader), handshake_timeout)
+                if frame_type != frame_challenge:
+                    raise ConnectionError(f'expected a CHALLENGE, got frame type {frame_type}')
+                connection.write(encode_hello(session, name, decode_challenge(body), secret))
+                frame_type, body = await asyncio.wait_for(read_frame(reader), handshake_timeout)
+                if frame_type != frame_ack:
+                    raise ConnectionError(f'expected an ACK, got frame type {frame_type}')
+                acknowledge(decode_ack(body))
+
+                # replay, with no awaits until the connection is in place, so no new event is missed
+                for number, frame in unacked:
+                    connection.write(frame)
+                writer = connection
+                delay  = reconnect_delay
+                logger.info('Connected to %s as %s, replayed %s events', connect, name, len(unacked))
+
+                while True:
+                    frame_type, body = await read_frame(reader)
+                    if frame_type == frame_ack:
+                        acknowledge(decode_ack(body))
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, struct.error) as e:
+                logger.warning('Not connected to %s, retrying in %.1fs: %s', connect, delay, e or type(e).__name__)
+            finally:
+                writer = None
+                if connection:
+                    connection.close()
+            await asyncio.sleep(delay)
+            delay = min(reconnect_delay_max, delay * 2)
+    finally:
+        for sensor in sensors:
+            sensor.close()
+        if trace:
+            trace['file'].close()
+
+
+#==[ COMMAND LINE ]========================================================================================================================
+
+if __name__ == "__main__":
+
+    # values are set from (in order):
+    #   1. environment variables
+    #   2. command line arguments
+    parser = argparse.ArgumentParser(description = 'Sensor agent for Laundromatic, streams sensor events to the bot')
+
+    parser.add_argument('-c',
+                        '--connect',
+                        dest    = 'connect',
+                        type    = str,
+                        default = os.environ.get('LAUNDROMATIC_CONNECT'),
+                        help    = 'Address the bot listens on, as "unix:/path/to/socket" or "host:port"')
+
+    parser.add_argument('-s',
+                        '--secret',
+                        dest    = 'secret',
+                        type    = str,
+                        default = os.environ.get('LAUNDROMATIC_SECRET'),
+                        help    = 'Secret shared with the bot, to sign the HELLO with (required over TCP)')
+
+    parser.add_argument('-m',
+                        '--machine',
+                        dest    = 'machines',
+                        type    = parse_machine,
+                        action  = 'append',
+                        help    = 'Machine name and GPIO pin as "name=gpiopin" (can be used multiple times)')
+
+    parser.add_argument('-g',
+                        '--gpio',
+                        '--pin',
+                        dest    = 'gpiopin',
+                        type    = int,
+                        default = 4,
+                        help    = f'GPIO pin of the sensor, when no machines are given (watched as "{default_machine}")')
+
+    parser.add_argument('-n',
+                        '--name',
+                        dest    = 'name',
+                        type    = str,
+                        help    = 'Name of this agent, in the bot\'s log (defaults to the host name)')
+
+    parser.add_argument('--detector',
+                        dest    = 'detector',
+                        action  = 'store_true',
+                        help    = 'Sample the sensors through a signal detector, instead of sending every edge')
+
+    parser.add_argument('--record',
+                        dest    = 'record',
+                        type    = str,
+                        default = os.environ.get('LAUNDROMATIC_RECORD'),
+                        help    = 'Path of a trace file to record every raw edge of the sensors to (appended to if it exists), for replay.py')
+
+    parser.add_argument('-l',
+                        '--loglevel',
+                        dest    = 'loglevel',
+                        type    = str.upper,
+                        default = 'INFO',
+                        choices = [ 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL' ],
+                        help    = 'Logging Level')
+
+    args = parser.parse_args()
+    if not args.connect:
+        parser.error('the address of the bot is required (--connect or LAUNDROMATIC_CONNECT)')
+    try:
+        if parse_address(args.connect)[0] == 'tcp' and not args.secret:
+            parser.error('a secret shared with the bot is required over TCP (--secret or LAUNDROMATIC_SECRET)')
+    except ValueError as e:
+        parser.error(str(e))
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('[ %(asctime)-23s ][ %(name)-8s ][ %(levelname)-8s ][ %(funcName)-20s ] (%(filename)s:%(lineno)s) - %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(args.loglevel)
+
+    # stop cleanly on SIGTERM too, releasing the GPIO pins
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    try:
+        asyncio.run(run_agent(args.connect,
+                              dict(args.machines or []) or { default_machine: { 'gpiopin': args.gpiopin } },
+                              args.name,
+                              args.detector,
+                              args.record,
+                              args.secret))
+    except KeyboardInterrupt:
+        pass
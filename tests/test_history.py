@@ -0,0 +1,95 @@
+#==[ IMPORTS ]=============================================================================================================================
+
+import statistics
+import pytest
+from datetime import datetime, timedelta
+from main import (open_history, store_cycle, load_cycles, count_cycles, load_stats, load_estimates, update_estimate,
+                  to_arizona_time, estimate_weight)
+
+
+#==[ HELPERS ]=============================================================================================================================
+
+# a day, at noon in the time shown in messages (so it's the same day there)
+day = datetime(2024, 3, 4, 12) + timedelta(hours = 7)
+
+@pytest.fixture
+def history(tmp_path):
+    history = open_history(str(tmp_path / 'history.db'))
+    yield history
+    history.close()
+
+# add a cycle that ended `minutes` after starting, at a number of hours past the day's noon
+def add_cycle(history, machine, minutes, hours = 0, days = 0):
+    ended = day + timedelta(days = days, hours = hours)
+    store_cycle(history, machine, ended - timedelta(minutes = minutes) if minutes is not None else None, ended)
+    return
+
+
+#==[ TESTS ]===============================================================================================================================
+
+# the daily rollups count every cycle, by machine and day
+def test_rollup_counts(history):
+    add_cycle(history, 'washer', 30)
+    add_cycle(history, 'washer', None, hours = 1) # no start, after a restart
+    add_cycle(history, 'dryer',  45)
+    add_cycle(history, 'washer', 30, days = -2)
+    today = to_arizona_time(day).date()
+    assert count_cycles(history, [ 'washer' ], today) == 2
+    assert count_cycles(history, [ 'washer' ], today - timedelta(days = 2)) == 3
+    assert count_cycles(history, [ 'washer', 'dryer' ], today) == 3
+    assert count_cycles(history, [ 'washer' ], today + timedelta(days = 1)) == 0
+
+# the average only counts the cycles with a known duration, and the hours are busiest first
+def test_stats(history):
+    add_cycle(history, 'washer', 30)
+    add_cycle(history, 'washer', 60)
+    add_cycle(history, 'washer', None, hours = 1)
+    stats = load_stats(history, [ 'washer' ], to_arizona_time(day).date())
+    assert stats['cycles']  == 3
+    assert stats['average'] == 45 * 60
+    assert stats['hours']   == [ (12, 2), (13, 1) ]
+
+# the percentiles are the first duration (in whole minutes) that many of the timed cycles took at most
+def test_percentile_buckets(history):
+    for minutes in (10, 20, 30, 40, 50, 60, 70, 80, 90, 100):
+        add_cycle(history, 'washer', minutes + 0.5)
+    stats = load_stats(history, [ 'washer' ], to_arizona_time(day).date())
+    assert stats['percentiles'] == { 0.5: 50, 0.9: 90 }
+
+# without timed cycles, there's no average or percentiles
+def test_stats_without_durations(history):
+    add_cycle(history, 'washer', None)
+    stats = load_stats(history, [ 'washer' ], to_arizona_time(day).date())
+    assert (stats['cycles'], stats['average'], stats['percentiles']) == (1, None, {})
+
+# cycles are listed newest first, and the estimates are saved along with them
+def test_cycles_and_estimates(history):
+    add_cycle(history, 'washer', 30)
+    store_cycle(history, 'washer', day, day + timedelta(hours = 1), { 1: (1, 3600.0, 0.0), -1: (2, 2700.0, 810000.0) })
+    cycles = load_cycles(history, [ 'washer' ], 1)
+    assert cycles == [ ('washer', day, day + timedelta(hours = 1), 3600.0) ]
+    assert load_estimates(history) == { 'washer': { 1: (1, 3600.0, 0.0), -1: (2, 2700.0, 810000.0) } }
+
+# the estimate is the exact mean and (population) variance, until it has 1 / estimate_weight cycles
+def test_estimate_is_exact_at_first():
+    durations = [ 1800, 2400, 2100, 3000, 1500, 2700, 2000, 2200, 2600, 1900 ][:round(1 / estimate_weight)]
+    estimate  = None
+    for count, duration in enumerate(durations, 1):
+        estimate = update_estimate(estimate, duration)
+        assert estimate[0] == count
+        assert estimate[1] == pytest.approx(statistics.mean(durations[:count]))
+        assert estimate[2] == pytest.approx(statistics.pvariance(durations[:count]))
+
+# after that, each cycle has a fixed weight, so the estimate follows a change in the cycles
+def test_estimate_follows_changes():
+    estimate = None
+    for duration in [ 1800 ] * 50:
+        estimate = update_estimate(estimate, duration)
+    assert estimate[1:] == pytest.approx((1800, 0))
+
+    estimate = update_estimate(estimate, 3600)
+    assert estimate[1] == pytest.approx(1800 + estimate_weight * 1800)
+    for duration in [ 3600 ] * 100:
+        estimate = update_estimate(estimate, duration)
+    assert estimate[0] == 151
+    assert estimate[1] == pytest.approx(3600, rel = 1e-3)
@@ -0,0 +1,79 @@
+#==[ IMPORTS ]=============================================================================================================================
+
+import pytest
+import main
+from main import open_outbox, store_outbox_message, load_outbox, remove_outbox_messages
+
+
+#==[ HELPERS ]=============================================================================================================================
+
+start = 1_700_000_000.0 # unix time the messages are stored at
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = open_outbox(str(tmp_path / 'outbox.db'))
+    yield outbox
+    outbox.close()
+
+# a clock the messages are stored with, set in seconds
+@pytest.fixture
+def clock(monkeypatch):
+    now = [ start ]
+    monkeypatch.setattr(main.time, 'time', lambda: now[0])
+    return now
+
+
+#==[ TESTS ]===============================================================================================================================
+
+# each message gets the next ID, and has a row per recipient, oldest first
+def test_store_and_load(outbox, clock):
+    assert store_outbox_message(outbox, 'washer done', [ 'channel:laundry', 'user:1' ]) == 1
+    clock[0] += 60
+    assert store_outbox_message(outbox, 'dryer done', [ 'user:2' ]) == 2
+    assert load_outbox(outbox) == [ (1, 'channel:laundry', 'washer done', start),
+                                    (1, 'user:1',          'washer done', start),
+                                    (2, 'user:2',          'dryer done',  start + 60) ]
+
+# delivered rows are removed one recipient at a time, so the rest are still sent
+def test_remove_delivered(outbox, clock):
+    store_outbox_message(outbox, 'washer done', [ 'channel:laundry', 'user:1' ])
+    store_outbox_message(outbox, 'dryer done',  [ 'user:2' ])
+    remove_outbox_messages(outbox, [ (1, 'user:1'), (2, 'user:2') ])
+    assert load_outbox(outbox) == [ (1, 'channel:laundry', 'washer done', start) ]
+
+    # removing rows that are already gone does nothing
+    remove_outbox_messages(outbox, [ (1, 'user:1') ])
+    assert len(load_outbox(outbox)) == 1
+
+# messages past the maximum age are dropped when the next one is stored
+def test_age_pruning(outbox, clock):
+    store_outbox_message(outbox, 'washer done', [ 'user:1' ])
+    clock[0] += main.outbox_max_age.total_seconds() - 1
+    store_outbox_message(outbox, 'dryer done', [ 'user:1' ])
+    assert [ row[0] for row in load_outbox(outbox) ] == [ 1, 2 ]
+
+    clock[0] += 2
+    store_outbox_message(outbox, 'washer done', [ 'user:1' ])
+    assert [ row[0] for row in load_outbox(outbox) ] == [ 2, 3 ]
+
+# past the maximum size, the oldest rows are dropped first
+def test_size_pruning(outbox, clock, monkeypatch):
+    monkeypatch.setattr(main, 'outbox_max_rows', 3)
+    store_outbox_message(outbox, 'washer done', [ 'channel:laundry', 'user:1' ])
+    store_outbox_message(outbox, 'dryer done',  [ 'user:2' ])
+    assert len(load_outbox(outbox)) == 3
+
+    store_outbox_message(outbox, 'washer done', [ 'user:3', 'user:4' ])
+    assert [ row[:2] for row in load_outbox(outbox) ] == [ (2, 'user:2'), (3, 'user:3'), (3, 'user:4') ]
+
+# the outbox outlives the connection, for delivery after a restart
+def test_reopen(tmp_path, clock):
+    path   = str(tmp_path / 'outbox.db')
+    outbox = open_outbox(path)
+    store_outbox_message(outbox, 'washer done', [ 'user:1' ])
+    outbox.close()
+
+    outbox = open_outbox(path)
+    assert load_outbox(outbox) == [ (1, 'user:1', 'washer done', start) ]
+    assert store_outbox_message(outbox, 'dryer done', [ 'user:1' ]) == 2
+    outbox.close()
@@ -0,0 +1,53 @@
+#==[ IMPORTS ]=============================================================================================================================
+
+from sensor_agent import make_signal_detector, event_done, event_off
+
+
+#==[ HELPERS ]=============================================================================================================================
+
+# a detector over a window of 10 samples, that must stay "on" for 5 samples
+def small_detector(**settings):
+    return make_signal_detector(**{ 'rate': 10, 'window': 1, 'on': 0.5, 'off': 0.1, 'sustain': 0.5, **settings })
+
+# feed samples to a detector
+#   returns [ (index of the sample, event) ] for every sample that returned an event
+def feed(detect, samples):
+    return [ (index, event) for index, event in enumerate(detect(sample) for sample in samples) if event is not None ]
+
+
+#==[ TESTS ]===============================================================================================================================
+
+# the duty cycle reaches "on" at the 5th sample, and must stay there for 5 samples
+def test_steady_light_is_done_once_sustained():
+    assert feed(small_detector(), [ 1 ] * 30) == [ (8, event_done) ]
+
+# a burst of light keeps the window at or above "on" for less than the sustain (7 of 10 samples), so it isn't "done"
+def test_short_burst_is_not_done():
+    assert feed(small_detector(sustain = 1), [ 1 ] * 6 + [ 0 ] * 20) == []
+    assert feed(small_detector(sustain = 1), [ 1 ] * 9 + [ 0 ] * 20) == [ (13, event_done), (17, event_off) ]
+
+# a blinking LED keeps the duty cycle at 50%, below the "on" threshold
+def test_blinking_below_on_is_not_done():
+    assert feed(small_detector(on = 0.6), [ 1, 0 ] * 50) == []
+
+# "off" only once the window falls to the "off" threshold, 1 lit sample out of 10
+def test_off_after_done():
+    assert feed(small_detector(), [ 1 ] * 10 + [ 0 ] * 10) == [ (8, event_done), (18, event_off) ]
+
+# between the thresholds, the detector stays "done" without re-triggering
+def test_hysteresis_between_thresholds():
+    events = feed(small_detector(), [ 1 ] * 10 + [ 1, 1, 1, 0, 0, 0, 0, 0, 0, 0 ] * 5)
+    assert events == [ (8, event_done) ]
+
+# after "off", the next cycle is detected again
+def test_done_again_after_off():
+    events = feed(small_detector(), ([ 1 ] * 10 + [ 0 ] * 10) * 2)
+    assert events == [ (8, event_done), (18, event_off), (28, event_done), (38, event_off) ]
+
+# samples are truthy or not, not just 1 and 0
+def test_truthy_samples():
+    assert feed(small_detector(), [ True ] * 10) == feed(small_detector(), [ 5 ] * 10) == [ (8, event_done) ]
+
+# windows and sustains shorter than a sample still hold a single sample
+def test_tiny_window():
+    assert feed(small_detector(window = 0.01, sustain = 0.01), [ 0, 1, 0 ]) == [ (1, event_done), (2, event_off) ]
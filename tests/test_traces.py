@@ -0,0 +1,95 @@
+#==[ IMPORTS ]=============================================================================================================================
+
+import os
+import pytest
+import sensor_agent
+from sensor_agent import encode_varint, decode_trace, read_trace, open_trace, record_edge, trace_header
+
+
+#==[ HELPERS ]=============================================================================================================================
+
+start = 1_700_000_000_000_000 # unix time in microseconds the traces start at
+day   = 86_400_000_000        # microseconds
+
+# a clock the traces are recorded with, set in microseconds
+@pytest.fixture
+def clock(monkeypatch):
+    now = [ start ]
+    monkeypatch.setattr(sensor_agent.time, 'time_ns', lambda: now[0] * 1000)
+    return now
+
+# record edges to a trace, each as (unix time in microseconds, machine name, value)
+def record(path, clock, edges):
+    trace = open_trace(path)
+    for timestamp, machine, value in edges:
+        clock[0] = timestamp
+        record_edge(trace, machine, value)
+    trace['file'].close()
+    return
+
+
+#==[ TESTS ]===============================================================================================================================
+
+# varints hold 7 bits per byte
+def test_varint_lengths():
+    assert encode_varint(0)    == b'\x00'
+    assert encode_varint(0x7F) == b'\x7f'
+    assert encode_varint(0x80) == b'\x80\x01'
+    assert len(encode_varint(day)) == 6 # a day of microseconds is under 2 ** 42
+
+# edges of several machines come back as recorded, including gaps of minutes to weeks between them
+def test_round_trip(tmp_path, clock):
+    path  = tmp_path / 'sensors.trace'
+    edges = [ (start + 1,                  'washer', 1),
+              (start + 2,                  'dryer',  1),
+              (start + 300_000_000,        'washer', 0),
+              (start + 2 * day,            'dryer',  0),
+              (start + 30 * day + 123_456, 'washer', 1) ]
+    record(path, clock, edges)
+    assert list(read_trace(path)) == edges
+
+# each run appends to the trace, reusing the machines already in it
+def test_append_across_runs(tmp_path, clock):
+    path = tmp_path / 'sensors.trace'
+    record(path, clock, [ (start + 1, 'washer', 1) ])
+    size = os.path.getsize(path)
+    record(path, clock, [ (start + day, 'washer', 0), (start + day + 1, 'dryer', 1) ])
+    assert list(read_trace(path)) == [ (start + 1, 'washer', 1), (start + day, 'washer', 0), (start + day + 1, 'dryer', 1) ]
+
+    # the washer's name isn't recorded again
+    data = path.read_bytes()
+    assert data.count(b'washer') == 1
+    assert len(data) > size
+
+# a record cut short (by a crash while writing) ends the trace, and is dropped before appending
+def test_truncated_trace(tmp_path, clock):
+    path  = tmp_path / 'sensors.trace'
+    edges = [ (start + 1, 'washer', 1), (start + 10 * day, 'washer', 0) ]
+    record(path, clock, edges)
+    data = path.read_bytes()
+    path.write_bytes(data[:-2]) # part way through the last edge's varint
+    assert list(read_trace(path)) == edges[:1]
+
+    record(path, clock, [ (start + 11 * day, 'washer', 1) ])
+    assert list(read_trace(path)) == [ edges[0], (start + 11 * day, 'washer', 1) ]
+
+# a machine name cut short ends the trace too
+def test_truncated_machine_name(tmp_path, clock):
+    path = tmp_path / 'sensors.trace'
+    record(path, clock, [ (start + 1, 'washer', 1), (start + 2, 'dryer', 1) ])
+    data = path.read_bytes()
+    path.write_bytes(data[:data.index(b'dryer') + 2])
+    assert list(read_trace(path)) == [ (start + 1, 'washer', 1) ]
+
+# the clock stepping back records the edge at the time of the one before
+def test_clock_stepping_back(tmp_path, clock):
+    path = tmp_path / 'sensors.trace'
+    record(path, clock, [ (start + day, 'washer', 1), (start + 1, 'washer', 0) ])
+    assert list(read_trace(path)) == [ (start + day, 'washer', 1), (start + day, 'washer', 0) ]
+
+# anything else isn't a trace
+def test_not_a_trace():
+    with pytest.raises(ValueError):
+        list(decode_trace(b'LTRC'))
+    with pytest.raises(ValueError):
+        list(decode_trace(b'NOPE' + bytes(trace_header.size)))
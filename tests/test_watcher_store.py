@@ -0,0 +1,52 @@
+#==[ IMPORTS ]=============================================================================================================================
+
+import pytest
+from main import open_watcher_store, load_watchers, store_watchers
+
+
+#==[ HELPERS ]=============================================================================================================================
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'watchers.db')
+
+@pytest.fixture
+def store(path):
+    store = open_watcher_store(path)
+    yield store
+    store.close()
+
+
+#==[ TESTS ]===============================================================================================================================
+
+# a new store has the machine in its key, and nothing in it
+def test_new_store(store):
+    columns = [ row[1] for row in store.execute('PRAGMA table_info(watchers)') ]
+    assert columns == [ 'machine', 'user_id', 'watching', 'updated' ]
+    assert load_watchers(store) == {}
+
+# watchers are kept by machine, with user IDs as strings
+def test_store_and_load(store):
+    store_watchers(store, 'washer', [ 1, 2 ])
+    store_watchers(store, 'dryer',  [ 2 ])
+    assert load_watchers(store) == { 'washer': { '1': True, '2': True }, 'dryer': { '2': True } }
+
+# removed watchers are kept as not watching, and only on that machine
+def test_remove(store):
+    store_watchers(store, 'washer', [ 1, 2 ])
+    store_watchers(store, 'dryer',  [ 1 ])
+    store_watchers(store, 'washer', [ 1 ], watching = False)
+    assert load_watchers(store) == { 'washer': { '1': False, '2': True }, 'dryer': { '1': True } }
+
+    store_watchers(store, 'washer', [ 1 ])
+    assert load_watchers(store)['washer']['1'] is True
+
+# the store outlives the connection, and reopening it keeps what's in it
+def test_reopen(path):
+    store = open_watcher_store(path)
+    store_watchers(store, 'washer', [ 1 ])
+    store.close()
+
+    store = open_watcher_store(path)
+    assert load_watchers(store) == { 'washer': { '1': True } }
+    store.close()